@@ -3,12 +3,13 @@ import click
 
 # TODO: setup logger here, must setup logger before modules are imported
 
-from .lithium.cli import daemon as lithium_daemon
+from .lithium.cli import daemon as lithium_daemon, proofserver as lithium_proofserver
 from .example.swap import COMMANDS as swap_commands
 
 
 COMMANDS = click.Group()
 COMMANDS.add_command(lithium_daemon, name="lithium")
+COMMANDS.add_command(lithium_proofserver, name="proofserver")
 COMMANDS.add_command(swap_commands)
 
 
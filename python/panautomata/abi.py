@@ -0,0 +1,176 @@
+# Copyright (c) 2018 HarryR. All Rights Reserved.
+# SPDX-License-Identifier: LGPL-3.0+
+
+"""
+Process-wide registry of parsed contract ABIs
+
+Each ABI, or truffle build artifact, is parsed once. The signature, selector
+and the encoder and decoder of every function are computed when it's first
+loaded, so creating a proxy with `EthJsonRpc.proxy` for an ABI which has
+already been seen is cheap:
+
+    abi = ABI_REGISTRY.load('../solidity/build/contracts/LithiumLink.json')
+    data = abi.function('Submit').encode([_a, _b])
+"""
+
+import os
+import json
+import threading
+from io import IOBase
+from functools import lru_cache
+from collections import namedtuple
+
+from eth_abi.registry import registry
+from eth_abi.decoding import ContextFramesBytesIO
+
+from .crypto import keccak_256
+from .utils import require
+
+
+@lru_cache(maxsize=1024)
+def function_selector(signature):
+    """First 4 bytes of the hash of a function signature, e.g. `transfer(address,uint256)`"""
+    return keccak_256(signature.encode('utf-8')).digest()[:4]
+
+
+def signature_str(node):
+    """Type of an input or output, tuples are expanded to their components"""
+    if node['type'] != 'tuple':
+        return node['type']
+    return '(' + ','.join([signature_str(_) for _ in node['components']]) + ')'
+
+
+def signature_list(node):
+    if node['type'] != 'tuple':
+        return node['type']
+    return ','.join([signature_str(_) for _ in node['components']])
+
+
+class AbiFunction(object):
+    """
+    Precompiled encoder and decoder for the arguments and results of a function
+    """
+    __slots__ = ('name', 'signature', 'selector', 'alias', 'inputs', 'outputs', 'constant', '_encoder', '_decoder')
+
+    def __init__(self, method):
+        self.name = method['name']
+        self.inputs = [signature_str(_) for _ in method['inputs']]
+        self.outputs = [signature_list(_) for _ in method['outputs']]
+        self.constant = bool(method.get('constant'))
+        self.signature = self.name + '(' + ','.join(self.inputs) + ')'
+        self.selector = function_selector(self.signature)
+
+        # Alternate name, with the hash of the signature as written in the ABI
+        sig = "%s(%s)" % (self.name, ','.join([_['type'] for _ in method['inputs']]))
+        self.alias = self.name + '_' + keccak_256(sig.encode('utf-8')).hexdigest()[:8]
+
+        self._encoder = registry.get_encoder('(' + ','.join(self.inputs) + ')')
+        self._decoder = registry.get_decoder('(' + ','.join(self.outputs) + ')')
+
+    def encode(self, args):
+        """Call data for the function with the arguments"""
+        return self.selector + self._encoder(tuple(args))
+
+    def decode(self, data):
+        """Tuple of all results returned by the function"""
+        return self._decoder(ContextFramesBytesIO(data))
+
+    def decode_result(self, data):
+        """
+        Result returned by the function, a single result is returned without
+        a tuple, and None when the function has no results.
+        """
+        if not self.outputs:
+            return None
+        result = self.decode(data)
+        if len(self.outputs) == 1:
+            return result[0]
+        return result
+
+    def __repr__(self):
+        return 'AbiFunction(%s)' % (self.signature,)
+
+
+class ContractAbi(object):
+    """
+    All functions of a contract, by name
+
+    When function names are overloaded, the last is used for the name but
+    each remains accessible by its alias.
+    """
+    def __init__(self, abi):
+        self.functions = [AbiFunction(_) for _ in abi if _['type'] == 'function']
+        self._by_name = dict()
+        for function in self.functions:
+            self._by_name[function.name] = function
+            self._by_name[function.alias] = function
+        # The proxy types, without and with an account to transact from
+        self._proxy_types = [self._make_proxy_type(False), self._make_proxy_type(True)]
+
+    def _make_proxy_type(self, transact):
+        names = [name for name, function in self._by_name.items() if transact or function.constant]
+        return namedtuple('SolProxy', names)
+
+    def function(self, name):
+        return self._by_name[name]
+
+    def __iter__(self):
+        return iter(self._by_name.items())
+
+    def proxy_type(self, transact):
+        """namedtuple type with a field for each function, non-constant functions only when `transact`"""
+        return self._proxy_types[bool(transact)]
+
+
+class AbiRegistry(object):
+    """
+    Cache of `ContractAbi`, by the path of the file it was loaded from or by
+    its contents.
+    """
+    def __init__(self):
+        self._abis = dict()
+        self._lock = threading.Lock()
+
+    def load(self, abi):
+        """
+        Returns the `ContractAbi` for a filename, open file, truffle build
+        artifact or a list of ABI entries.
+        """
+        if isinstance(abi, ContractAbi):
+            return abi
+
+        key = None
+        if isinstance(abi, str):
+            path = os.path.abspath(abi)
+            key = (path, os.stat(path).st_mtime)
+            with self._lock:
+                if key in self._abis:
+                    return self._abis[key]
+            with open(path) as jsonfile:
+                abi = json.load(jsonfile)
+        elif isinstance(abi, IOBase):
+            abi = json.load(abi)
+
+        # Accept either .abi file, or a .json file which contains abi
+        if isinstance(abi, dict) and 'abi' in abi:
+            abi = abi['abi']
+        else:
+            require(isinstance(abi, list), "Abi must be list, incorrect format")
+
+        if key is None:
+            key = json.dumps(abi, sort_keys=True)
+            with self._lock:
+                if key in self._abis:
+                    return self._abis[key]
+
+        contract_abi = ContractAbi(abi)
+        with self._lock:
+            self._abis[key] = contract_abi
+        return contract_abi
+
+    def clear(self):
+        with self._lock:
+            self._abis.clear()
+
+
+ABI_REGISTRY = AbiRegistry()
@@ -0,0 +1,364 @@
+# Copyright (c) 2018 HarryR. All Rights Reserved.
+# SPDX-License-Identifier: LGPL-3.0+
+
+"""
+Asynchronous Ethereum JSON-RPC client, using asyncio
+
+The same methods as `EthJsonRpc` are available, but each returns a coroutine:
+
+    rpc = AsyncEthJsonRpc('127.0.0.1', 8545)
+    receipts = await asyncio.gather(*[rpc.eth_getTransactionReceipt(_) for _ in tx_hashes])
+
+Requests are sent over a bounded pool of keep-alive HTTP/1.1 connections,
+so many requests can be in-flight at once without opening a new connection
+for each of them.
+"""
+
+import json
+import asyncio
+import ssl
+from collections import namedtuple
+from binascii import hexlify
+from itertools import count
+
+from eth_abi import encode_abi, decode_abi
+
+from .utils import CustomJSONEncoder, normalise_address
+from .ethrpc import (EthJsonRpc, EthJsonRpcBatch, EthJsonRpcError, ConnectionError, BadStatusCodeError,
+                     BadJsonError, BadResponseError, hex_to_dec, clean_hex, validate_block, call_result_bytes,
+                     GETH_DEFAULT_RPC_PORT, BLOCK_TAG_LATEST, BLOCK_TAGS, JSON_MEDIA_TYPE)
+
+
+DEFAULT_MAX_CONNECTIONS = 16
+
+DEFAULT_TIMEOUT = 60
+
+
+class AsyncEthTransaction(namedtuple('_AsyncTxStruct', ('rpc', 'txid'))):
+    async def details(self):
+        return await self.rpc.eth_getTransactionByHash(self.txid)
+
+    async def wait(self):
+        return await self.receipt(wait=True)
+
+    async def success(self, wait=True):
+        receipt = await self.receipt(wait=wait)
+        return receipt['status'] != '0x0'
+
+    async def receipt(self, wait=False, interval=1):
+        while True:
+            receipt = await self.rpc.eth_getTransactionReceipt(self.txid)
+            if receipt or not wait:
+                return receipt
+            await asyncio.sleep(interval)
+
+    def __str__(self):
+        return self.txid
+
+
+class AsyncEthJsonRpcBatch(EthJsonRpcBatch):
+    """
+    Queues calls to be sent as a single batch request, upon exit of an
+    `async with` block.
+    """
+    async def send(self):
+        calls, futures = self._calls, self._futures
+        self._calls, self._futures = [], []
+        await self._rpc._call_batch(calls, futures)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            await self.send()
+
+
+class AsyncEthJsonRpc(EthJsonRpc):
+    '''
+    Asynchronous Ethereum JSON-RPC client class
+
+    Methods which only forward their result from the server are inherited
+    from `EthJsonRpc` and return the coroutine of `_call`, those which
+    convert the result are overridden.
+    '''
+
+    def __init__(self, host='localhost', port=GETH_DEFAULT_RPC_PORT, tls=False,
+                 max_connections=DEFAULT_MAX_CONNECTIONS, timeout=DEFAULT_TIMEOUT, cache=None):
+        # The `requests` session of EthJsonRpc isn't used
+        self.host = host
+        self.port = port
+        self.tls = tls
+        self.timeout = timeout
+        self.cache = cache
+        self._ids = count(1)
+        self._max_connections = max_connections
+        self._semaphore = None
+        self._idle = []
+
+    async def _connect(self):
+        ssl_context = ssl.create_default_context() if self.tls else None
+        return await asyncio.open_connection(self.host, self.port, ssl=ssl_context)
+
+    async def _request(self, conn, body):
+        """
+        Sends a HTTP POST request over the connection, returns the status
+        code, the body of the response and if the connection can be reused.
+        """
+        reader, writer = conn
+        writer.write(b''.join([
+            b'POST / HTTP/1.1\r\n',
+            b'Host: ', '{}:{}'.format(self.host, self.port).encode('ascii'), b'\r\n',
+            b'Content-Type: ', JSON_MEDIA_TYPE.encode('ascii'), b'\r\n',
+            b'Content-Length: ', str(len(body)).encode('ascii'), b'\r\n',
+            b'Connection: keep-alive\r\n',
+            b'\r\n',
+            body]))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(status_line, None)
+        status = int(status_line.split()[1])
+
+        headers = dict()
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = headers.get('connection', '').lower() != 'close'
+        if 'content-length' in headers:
+            data = await reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    # Discard trailers
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b''.join(chunks)
+        else:
+            data = await reader.read()
+            keep_alive = False
+        return status, data, keep_alive
+
+    async def _post(self, data):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_connections)
+        url = '{}://{}:{}'.format('https' if self.tls else 'http', self.host, self.port)
+        body = json.dumps(data, cls=CustomJSONEncoder).encode('utf-8')
+
+        async with self._semaphore:
+            # An idle connection may have been closed by the server, so
+            # the request is retried once on a fresh connection
+            while True:
+                reused = bool(self._idle)
+                conn = self._idle.pop() if reused else None
+                try:
+                    if conn is None:
+                        conn = await self._connect()
+                    status, response, keep_alive = await asyncio.wait_for(self._request(conn, body), self.timeout)
+                except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError, IndexError):
+                    if conn is not None:
+                        conn[1].close()
+                    if reused:
+                        continue
+                    raise ConnectionError(url)
+                break
+
+            if keep_alive:
+                self._idle.append(conn)
+            else:
+                conn[1].close()
+
+        if status // 100 != 2:
+            raise BadStatusCodeError(status)
+        try:
+            return json.loads(response.decode('utf-8'))
+        except ValueError:
+            raise BadJsonError(response)
+
+    async def close(self):
+        """Closes all idle connections"""
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+
+    async def _call(self, method, params=None, _id=None):
+        params = params or []
+        if self.cache is not None:
+            result = self.cache.get(method, params)
+            if result is not None:
+                return result
+        if _id is None:
+            _id = next(self._ids)
+        data = {
+            'jsonrpc': '2.0',
+            'method': method,
+            'params': params,
+            'id': _id,
+        }
+        response = await self._post(data)
+        try:
+            result = response['result']
+        except KeyError:
+            raise BadResponseError(response)
+        if self.cache is not None:
+            self.cache.put(method, params, result)
+        return result
+
+    async def _call_batch(self, calls, futures=None):
+        if futures is None:
+            futures = [asyncio.Future() for _ in calls]
+        pending_calls, pending_futures = self._batch_uncached(calls, futures)
+        if not pending_calls:
+            return futures
+
+        ids, data = self._batch_request(pending_calls)
+        try:
+            responses = await self._post(data)
+        except EthJsonRpcError as ex:
+            responses = ex
+        self._batch_resolve(ids, responses, pending_futures)
+        self._batch_store(pending_calls, pending_futures)
+        return futures
+
+    def batch(self, calls=None):
+        """
+        Coroutine for the results of many calls sent as a single request,
+        see `EthJsonRpc.batch`. Without any calls, returns an asynchronous
+        context manager.
+        """
+        if calls is None:
+            return AsyncEthJsonRpcBatch(self)
+        return self._batch_results(calls)
+
+    async def _batch_results(self, calls):
+        return [_.result() for _ in await self._call_batch(calls)]
+
+################################################################################
+# high-level methods
+################################################################################
+
+    async def receipt(self, txid, wait=False, raise_on_error=False):
+        receipt = await AsyncEthTransaction(self, txid).receipt(wait=wait)
+        if raise_on_error:
+            if int(receipt['status'], 16) == 0:
+                raise EthJsonRpcError("Transaction was aborted")
+        return receipt
+
+    async def receipt_wait(self, txid, raise_on_error=True):
+        return await self.receipt(txid, True, raise_on_error)
+
+    async def create_contract(self, from_, code, gas, sig=None, args=None):
+        from_ = from_ or await self.eth_coinbase()
+        if sig is not None and args is not None:
+            types = sig[sig.find('(') + 1: sig.find(')')].split(',')
+            encoded_params = encode_abi(types, args)
+            code += hexlify(encoded_params)
+        return await self.eth_sendTransaction(from_address=from_, gas=gas, data=code)
+
+    async def get_contract_address(self, tx):
+        receipt = await self.eth_getTransactionReceipt(tx)
+        return receipt['contractAddress']
+
+    async def call(self, address, sig, args, result_types, arg_types=None):
+        data = self._encode_function(sig, args, arg_types=arg_types)
+        response = await self.eth_call(to_address=address, data=hexlify(data))
+        return decode_abi(result_types, call_result_bytes(result_types, response))
+
+    async def call_function(self, address, function, args):
+        response = await self.eth_call(to_address=address, data=hexlify(function.encode(args)))
+        return function.decode_result(call_result_bytes(function.outputs, response))
+
+################################################################################
+# JSON-RPC methods which convert their result
+################################################################################
+
+    async def net_peerCount(self):
+        return hex_to_dec(await self._call('net_peerCount'))
+
+    async def eth_hashrate(self):
+        return hex_to_dec(await self._call('eth_hashrate'))
+
+    async def eth_gasPrice(self):
+        return hex_to_dec(await self._call('eth_gasPrice'))
+
+    async def eth_blockNumber(self):
+        return hex_to_dec(await self._call('eth_blockNumber'))
+
+    async def eth_getBalance(self, address=None, block=BLOCK_TAG_LATEST):
+        address = address or await self.eth_coinbase()
+        block = validate_block(block)
+        return hex_to_dec(await self._call('eth_getBalance', [address, block]))
+
+    async def eth_getTransactionCount(self, address, block=BLOCK_TAG_LATEST):
+        block = validate_block(block)
+        return hex_to_dec(await self._call('eth_getTransactionCount', [address, block]))
+
+    async def eth_getBlockTransactionCountByHash(self, block_hash):
+        return hex_to_dec(await self._call('eth_getBlockTransactionCountByHash', [block_hash]))
+
+    async def eth_getBlockTransactionCountByNumber(self, block=BLOCK_TAG_LATEST):
+        block = validate_block(block)
+        return hex_to_dec(await self._call('eth_getBlockTransactionCountByNumber', [block]))
+
+    async def eth_getUncleCountByBlockHash(self, block_hash):
+        return hex_to_dec(await self._call('eth_getUncleCountByBlockHash', [block_hash]))
+
+    async def eth_getUncleCountByBlockNumber(self, block=BLOCK_TAG_LATEST):
+        block = validate_block(block)
+        return hex_to_dec(await self._call('eth_getUncleCountByBlockNumber', [block]))
+
+    async def eth_estimateGas(self, to_address=None, from_address=None, gas=None, gas_price=None, value=None, data=None,
+                              default_block=BLOCK_TAG_LATEST):
+        if isinstance(default_block, str):
+            if default_block not in BLOCK_TAGS:
+                raise ValueError
+        obj = {}
+        if to_address is not None:
+            obj['to'] = normalise_address(to_address)
+        if from_address is not None:
+            obj['from'] = normalise_address(from_address)
+        if gas is not None:
+            obj['gas'] = hex(gas)
+        if gas_price is not None:
+            obj['gasPrice'] = clean_hex(gas_price)
+        if value is not None:
+            obj['value'] = value
+        if data is not None:
+            obj['data'] = data
+        return hex_to_dec(await self._call('eth_estimateGas', [obj, default_block]))
+
+    async def eth_newPendingTransactionFilter(self):
+        return hex_to_dec(await self._call('eth_newPendingTransactionFilter'))
+
+    async def eth_sendTransaction(self, to_address=None, from_address=None, gas=None, gas_price=None, value=None, data=None,
+                                  nonce=None):
+        if to_address is not None and len(to_address) == 20:
+            to_address = hexlify(to_address)
+        if len(from_address) == 20:
+            from_address = hexlify(from_address)
+        params = {}
+        params['from'] = normalise_address(from_address)
+        if to_address is not None:
+            params['to'] = normalise_address(to_address)
+        if gas is not None:
+            params['gas'] = hex(gas)
+        if gas_price is not None:
+            params['gasPrice'] = clean_hex(gas_price)
+        if value is not None:
+            params['value'] = clean_hex(value)
+        if data is not None:
+            params['data'] = data.decode('utf-8')
+        if nonce is not None:
+            params['nonce'] = hex(nonce)
+        txid = await self._call('eth_sendTransaction', [params])
+        return AsyncEthTransaction(self, txid)
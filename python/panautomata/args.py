@@ -10,6 +10,7 @@ Provides a set of useful arguements for interacting with ethrpc
 import time
 
 from .ethrpc import EthJsonRpc
+from .rpcpool import EthJsonRpcPool
 from .utils import require, scan_bin
 
 
@@ -65,11 +66,20 @@ arg_uint256 = make_uint_n(256)
 
 
 def arg_ethrpc(ctx, param, value):
+    """
+    Accepts `ip:port`, or a comma separated list of them for a pool of
+    nodes of the same chain.
+    """
     if value is None:
         return None
-    ip_addr, port = value.split(':')
-    port = int(port)
-    require(port > 0)
-    require(port < 0xFFFF)
-    use_tls = port == 443
-    return EthJsonRpc(ip_addr, port, use_tls)
+    nodes = []
+    for endpoint in value.split(','):
+        ip_addr, port = endpoint.strip().split(':')
+        port = int(port)
+        require(port > 0)
+        require(port < 0xFFFF)
+        use_tls = port == 443
+        nodes.append(EthJsonRpc(ip_addr, port, use_tls))
+    if len(nodes) == 1:
+        return nodes[0]
+    return EthJsonRpcPool(nodes)
@@ -16,7 +16,7 @@ try:
     import coincurve
     has_coincurve = True
 except ImportError:
-    from py_ecc.secp256k1 import ecdsa_raw_recover, ecdsa_raw_sign
+    from py_ecc.secp256k1 import ecdsa_raw_recover, ecdsa_raw_sign, privtopub
     import warnings
     warnings.warn('could not import coincurve', ImportWarning)
     has_coincurve = False
@@ -47,7 +47,7 @@ class EcdsaSignature(_EcdsaSignatureStruct, Marshalled):
         if has_coincurve and hasattr(coincurve, "PublicKey"):
             try:
                 pk = coincurve.PublicKey.from_signature_and_message(
-                    ''.join([r, s, ascii_chr(v - 27)]),
+                    b''.join([r, s, ascii_chr(v - 27)]),
                     rawhash,
                     hasher=None,
                 )
@@ -86,3 +86,14 @@ def ecdsa_sign(rawhash, key):
         r = u256be(r)
         s = u256be(s)
     return EcdsaSignature(v, r, s)
+
+
+def ecdsa_address(key):
+    # type: (bytes) -> bytes
+    """Ethereum address of the private key"""
+    if has_coincurve and hasattr(coincurve, 'PrivateKey'):
+        pub = coincurve.PrivateKey(key).public_key.format(compressed=False)[1:]
+    else:
+        x, y = privtopub(key)
+        pub = u256be(x) + u256be(y)
+    return keccak_256(pub).digest()[12:]
@@ -30,15 +30,16 @@ import requests
 import time
 import warnings
 from binascii import hexlify, unhexlify
-from io import IOBase
+from itertools import count
 
 from collections import namedtuple
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from eth_abi import encode_abi, decode_abi
 from requests.adapters import HTTPAdapter
-from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout as RequestsTimeout
 
-from .crypto import keccak_256
-from .utils import CustomJSONEncoder, require, normalise_address
+from .abi import ABI_REGISTRY, function_selector, signature_str, signature_list
+from .utils import CustomJSONEncoder, normalise_address
 
 GETH_DEFAULT_RPC_PORT = 8545
 ETH_DEFAULT_RPC_PORT = 8545
@@ -102,6 +103,16 @@ def validate_block(block):
     return block
 
 
+def call_result_bytes(result_types, response):
+    '''
+    Result of `eth_call` as bytes, to be decoded as `result_types`
+    '''
+    # XXX: horrible hack for when RPC returns '0x0'...
+    if (len(result_types) == 0 or result_types[0] == 'uint256') and response == '0x0':
+        response = '0x' + ('0' * 64)
+    return unhexlify(response[2:])
+
+
 def wei_to_ether(wei):
     '''
     Convert wei to ether
@@ -136,6 +147,9 @@ class EthTransaction(namedtuple('_TxStruct', ('rpc', 'txid'))):
         txid = self.txid
         if txid[:2] != '0x':
             txid = '0x' + txid
+        watcher = getattr(self.rpc, 'watcher', None)
+        if wait and watcher is not None:
+            return self._receipt_watched(watcher, wait, tick_fn)
         while True:
             receipt = self.rpc.eth_getTransactionReceipt(txid)
             # TODO: turn into asynchronous notification / future
@@ -154,10 +168,56 @@ class EthTransaction(namedtuple('_TxStruct', ('rpc', 'txid'))):
             except KeyboardInterrupt:
                 break
 
+    def _receipt_watched(self, watcher, wait, tick_fn):
+        """Wait for the receipt to be found by the shared `ReceiptWatcher`"""
+        future = watcher.watch(self)
+        if hasattr(wait, '__call__'):
+            wait()
+        while True:
+            try:
+                return future.result(timeout=1)
+            except FutureTimeoutError:
+                if tick_fn:
+                    tick_fn(self)
+            except KeyboardInterrupt:
+                break
+
     def __str__(self):
         return self.txid
 
 
+class EthJsonRpcBatch(object):
+    """
+    Queues JSON-RPC calls to be sent as a single batch request, see `EthJsonRpc.batch`
+    """
+    def __init__(self, rpc):
+        self._rpc = rpc
+        self._calls = []
+        self._futures = []
+
+    def call(self, method, params=None):
+        """
+        Queue a call, returns a `Future` which is resolved once the batch has been sent
+        """
+        future = Future()
+        self._calls.append((method, params))
+        self._futures.append(future)
+        return future
+
+    def send(self):
+        """Sends all queued calls, resolving their futures"""
+        calls, futures = self._calls, self._futures
+        self._calls, self._futures = [], []
+        self._rpc._call_batch(calls, futures)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.send()
+
+
 class EthJsonRpc(object):
     '''
     Ethereum JSON-RPC client class
@@ -166,22 +226,19 @@ class EthJsonRpc(object):
     DEFAULT_GAS_PER_TX = 900000
     DEFAULT_GAS_PRICE = 50 * 10**9  # 50 gwei
 
-    def __init__(self, host='localhost', port=GETH_DEFAULT_RPC_PORT, tls=False):
+    def __init__(self, host='localhost', port=GETH_DEFAULT_RPC_PORT, tls=False, cache=None, timeout=None):
         self.host = host
         self.port = port
         self.tls = tls
+        self.cache = cache
+        # Seconds to wait for a response, or None to wait forever
+        self.timeout = timeout
+        self.watcher = None
         self.session = requests.Session()
         self.session.mount(self.host, HTTPAdapter(max_retries=MAX_RETRIES))
+        self._ids = count(1)
 
-    def _call(self, method, params=None, _id=1):
-
-        params = params or []
-        data = {
-            'jsonrpc': '2.0',
-            'method': method,
-            'params': params,
-            'id': _id,
-        }
+    def _post(self, data):
         scheme = 'http'
         if self.tls:
             scheme += 's'
@@ -189,22 +246,139 @@ class EthJsonRpc(object):
         headers = {'Content-Type': JSON_MEDIA_TYPE}
         try:
             encoded_data = json.dumps(data, cls=CustomJSONEncoder)
-            r = self.session.post(url, headers=headers, data=encoded_data)
-        except RequestsConnectionError:
+            r = self.session.post(url, headers=headers, data=encoded_data, timeout=self.timeout)
+        except (RequestsConnectionError, RequestsTimeout):
             raise ConnectionError(url)
         if r.status_code / 100 != 2:
             raise BadStatusCodeError(r.status_code)
         try:
-            response = r.json()
+            return r.json()
         except ValueError:
             raise BadJsonError(r.text)
+
+    def _call(self, method, params=None, _id=None):
+        params = params or []
+        if self.cache is not None:
+            result = self.cache.get(method, params)
+            if result is not None:
+                return result
+        if _id is None:
+            _id = next(self._ids)
+        data = {
+            'jsonrpc': '2.0',
+            'method': method,
+            'params': params,
+            'id': _id,
+        }
+        response = self._post(data)
         try:
-            return response['result']
+            result = response['result']
         except KeyError:
             raise BadResponseError(response)
+        if self.cache is not None:
+            self.cache.put(method, params, result)
+        return result
+
+    def _call_batch(self, calls, futures=None):
+        """
+        Sends a list of `(method, params)` as a single JSON-RPC batch request,
+        returns a list of futures in the same order as the calls. Optionally
+        the futures to resolve may be provided.
+
+        Each call has a unique id, responses are matched to calls by their id
+        as the server may return them in any order. Errors for an individual
+        call are raised by the result of its future.
+        """
+        if futures is None:
+            futures = [Future() for _ in calls]
+        pending_calls, pending_futures = self._batch_uncached(calls, futures)
+        if not pending_calls:
+            return futures
+
+        ids, data = self._batch_request(pending_calls)
+        try:
+            responses = self._post(data)
+        except EthJsonRpcError as ex:
+            responses = ex
+        self._batch_resolve(ids, responses, pending_futures)
+        self._batch_store(pending_calls, pending_futures)
+        return futures
+
+    def _batch_uncached(self, calls, futures):
+        """
+        Resolve the futures of calls which are cached, returns the calls and
+        futures which must be sent.
+        """
+        if self.cache is None:
+            return calls, futures
+        pending_calls, pending_futures = [], []
+        for (method, params), future in zip(calls, futures):
+            result = self.cache.get(method, params)
+            if result is not None:
+                future.set_result(result)
+            else:
+                pending_calls.append((method, params))
+                pending_futures.append(future)
+        return pending_calls, pending_futures
+
+    def _batch_store(self, calls, futures):
+        if self.cache is None:
+            return
+        for (method, params), future in zip(calls, futures):
+            if future.exception() is None:
+                self.cache.put(method, params, future.result())
+
+    def _batch_request(self, calls):
+        """Returns the unique ids and the JSON-RPC payload for a batch of calls"""
+        ids = [next(self._ids) for _ in calls]
+        data = [{'jsonrpc': '2.0', 'method': method, 'params': params or [], 'id': _id}
+                for (method, params), _id in zip(calls, ids)]
+        return ids, data
+
+    @staticmethod
+    def _batch_resolve(ids, responses, futures):
+        """
+        Resolve the future for each call with the response which has the same
+        id, or with the exception if the whole batch failed.
+        """
+        if not isinstance(responses, (list, Exception)):
+            responses = BadResponseError(responses)
+        if isinstance(responses, Exception):
+            for future in futures:
+                future.set_exception(responses)
+            return
+
+        by_id = {_.get('id'): _ for _ in responses if isinstance(_, dict)}
+        for _id, future in zip(ids, futures):
+            response = by_id.get(_id)
+            if response is None:
+                future.set_exception(BadResponseError("No response for id %d" % (_id,)))
+            elif 'result' not in response:
+                future.set_exception(BadResponseError(response))
+            else:
+                future.set_result(response['result'])
+
+    def batch(self, calls=None):
+        """
+        Send many calls in a single request.
+
+        Given a list of `(method, params)` the results are returned in the
+        same order, raising `BadResponseError` if any of the calls failed.
+
+        Without any calls, returns a context manager which queues calls and
+        sends them together upon exit, e.g.
+
+            with rpc.batch() as batch:
+                tx = batch.call('eth_getTransactionByHash', [tx_hash])
+                receipt = batch.call('eth_getTransactionReceipt', [tx_hash])
+            print(tx.result(), receipt.result())
+        """
+        if calls is None:
+            return EthJsonRpcBatch(self)
+        return [_.result() for _ in self._call_batch(calls)]
 
     def _encode_function(self, signature, param_values, arg_types=None):
-        prefix = keccak_256(signature.encode('utf-8')).digest()[:4]
+        prefix = function_selector(signature)
         assert len(prefix) == 4
 
         if signature.find('(') == -1:
@@ -221,69 +395,39 @@ class EthJsonRpc(object):
         return prefix + encoded_params
 
     def _make_signature_str(self, node):
-        if node['type'] != 'tuple':
-            return node['type']
-        return '(' + ','.join([self._make_signature_str(_) for _ in node['components']]) + ')'
+        return signature_str(node)
 
     def _make_signature_list(self, node):
-        if node['type'] != 'tuple':
-            return node['type']
-        return ','.join([self._make_signature_str(_) for _ in node['components']])
-
-    def _solproxy_bind(self, method, address, account):
-        # XXX: messy, make signature str, vs make signature list... ewww
-        ins_str = [self._make_signature_str(_) for _ in method['inputs']]
-        outs = [self._make_signature_list(_) for _ in method['outputs']]
-        sig = method['name'] + '(' + ','.join(ins_str) + ')'
-        if method['constant']:
-            # XXX: document len(outs) and different behaviour...
-            if len(outs) > 1:
-                return lambda *args, **kwa: self.call(address, sig, args, outs, arg_types=ins_str, **kwa)
-            return lambda *args, **kwa: self.call(address, sig, args, outs, arg_types=ins_str, **kwa)[0]
-        if account is None:
-            return None
-        return lambda *args, **kwa: self.call_with_transaction(account, address, sig, args, arg_types=ins_str, **kwa)
+        return signature_list(node)
+
+    def _solproxy_bind(self, function, address, account):
+        """
+        Constant functions return their result, a single result is returned
+        without a tuple. Other functions send a transaction from `account`.
+        """
+        if function.constant:
+            return lambda *args: self.call_function(address, function, args)
+        return lambda *args, **kwa: self.transact_function(account, address, function, args, **kwa)
 
     def proxy(self, abi, address, account=None):
         """
         Provides a Python proxy object which exposes the contract ABI as
         callable methods, allowing for seamless use of contracts from Python...
+
+        The ABI is parsed only once, by the process-wide `ABI_REGISTRY`.
         """
         # XXX: specific to Ethereum addresses, 20 octets
         address = normalise_address(address)
 
-        if account is not None:
+        # Transactions may instead be signed locally, see `TransactionSender`
+        if account is not None and not hasattr(account, 'send_transaction'):
             account = normalise_address(account)
 
-        if isinstance(abi, IOBase):
-            abi = json.load(abi)
-        elif isinstance(abi, str):
-            with open(abi) as jsonfile:
-                abi = json.load(jsonfile)
-
-        # Accept either .abi file, or a .json file which contains abi
-        if isinstance(abi, dict) and 'abi' in abi:
-            abi = abi['abi']
-        else:
-            require(isinstance(abi, list), "Abi must be list, incorrect format")
-
-        proxy = dict()
-        for method in abi:
-            if method['type'] != 'function':
-                continue
-
-            handler = self._solproxy_bind(method, address, account)
-            if handler is None:
-                continue
-
-            sig = "%s(%s)" % (method['name'], ','.join([i['type'] for i in method['inputs']]))
-            sig_hash = keccak_256(sig.encode('utf-8')).hexdigest()[:8]
-
-            # Provide an alternate, where the explicit function signature
-            proxy[method['name']] = handler
-            proxy[method['name'] + '_' + sig_hash] = handler
-
-        return namedtuple('SolProxy', proxy.keys())(*proxy.values())
+        contract_abi = ABI_REGISTRY.load(abi)
+        proxy_type = contract_abi.proxy_type(account is not None)
+        handlers = {name: self._solproxy_bind(contract_abi.function(name), address, account)
+                    for name in proxy_type._fields}
+        return proxy_type(**handlers)
 
 ################################################################################
 # high-level methods
@@ -337,23 +481,41 @@ class EthJsonRpc(object):
         data = self._encode_function(sig, args, arg_types=arg_types)
         data_hex = hexlify(data)
         response = self.eth_call(to_address=address, data=data_hex)
-        # XXX: horrible hack for when RPC returns '0x0'...
-        if (len(result_types) == 0 or result_types[0] == 'uint256') and response == '0x0':
-            response = '0x' + ('0' * 64)
-        return decode_abi(result_types, unhexlify(response[2:]))
+        return decode_abi(result_types, call_result_bytes(result_types, response))
+
+    def call_function(self, address, function, args):
+        '''
+        Call an `AbiFunction` without sending a transaction, returns its result
+        '''
+        response = self.eth_call(to_address=address, data=hexlify(function.encode(args)))
+        return function.decode_result(call_result_bytes(function.outputs, response))
 
     def call_with_transaction(self, from_, address, sig, args, gas=None, gas_price=None, value=None, arg_types=None):
         '''
         Call a contract function by sending a transaction (useful for storing
         data)
         '''
+        data = self._encode_function(sig, args, arg_types=arg_types)
+        if hasattr(from_, 'send_transaction'):
+            return from_.send_transaction(to=address, data=data, value=value or 0, gas=gas, gas_price=gas_price)
         gas = gas or self.DEFAULT_GAS_PER_TX
         gas_price = gas_price or self.DEFAULT_GAS_PRICE
-        data = self._encode_function(sig, args, arg_types=arg_types)
         data_hex = hexlify(data)
         return self.eth_sendTransaction(from_address=from_, to_address=address, data=data_hex, gas=gas,
                                         gas_price=gas_price, value=value)
 
+    def transact_function(self, from_, address, function, args, gas=None, gas_price=None, value=None):
+        '''
+        Call an `AbiFunction` by sending a transaction
+        '''
+        data = function.encode(args)
+        if hasattr(from_, 'send_transaction'):
+            return from_.send_transaction(to=address, data=data, value=value or 0, gas=gas, gas_price=gas_price)
+        gas = gas or self.DEFAULT_GAS_PER_TX
+        gas_price = gas_price or self.DEFAULT_GAS_PRICE
+        return self.eth_sendTransaction(from_address=from_, to_address=address, data=hexlify(data),
+                                        gas=gas, gas_price=gas_price, value=value)
+
 ################################################################################
 # JSON-RPC methods
 ################################################################################
@@ -8,24 +8,66 @@ import click
 
 from ..args import arg_bytes20, arg_ethrpc
 
+from ..rpccache import EthJsonRpcCache
+
+from .common import ProofEngine, DEFAULT_PROOF_CACHE_SIZE, DEFAULT_PROOF_CACHE_TTL
 from .daemon import Lithium
+from .store import SqliteBlockStore
 
 
 @click.command(help="Ethereum event merkle tree relay daemon")
-@click.option('--rpc-from', callback=arg_ethrpc, metavar="ip:port", default='127.0.0.1:8545', help="Source Ethereum JSON-RPC server")
-@click.option('--rpc-to', callback=arg_ethrpc, metavar="ip:port", default='127.0.0.1:8546', help="Destination Ethereum JSON-RPC server")
+@click.option('--rpc-from', callback=arg_ethrpc, metavar="ip:port[,...]", default='127.0.0.1:8545', help="Source Ethereum JSON-RPC servers")
+@click.option('--rpc-to', callback=arg_ethrpc, metavar="ip:port[,...]", default='127.0.0.1:8546', help="Destination Ethereum JSON-RPC servers")
 @click.option('--account', callback=arg_bytes20, metavar="0x...20", required=True, help="Recipient")
 @click.option('--contract', callback=arg_bytes20, metavar="0x...20", required=True, help="IonLink contract address")
 @click.option('--batch-size', type=int, default=32, metavar="N", help="Upload at most N items per transaction")
+@click.option('--log-range', is_flag=True, help="Retrieve events with eth_getLogs for each batch of blocks, rather than each receipt")
+@click.option('--workers', type=int, default=1, metavar="N", help="Retrieve blocks and receipts with N concurrent requests")
+@click.option('--store', metavar="file", help="Keep relayed blocks in an SQLite database, for proofs")
 @click.option('--pid', metavar="file", help="Save pid to file")
-def daemon(rpc_from, rpc_to, account, contract, batch_size, pid):
+def daemon(rpc_from, rpc_to, account, contract, batch_size, log_range, workers, store, pid):
     if pid:
         with open(pid, 'w') as handle:
             handle.write(str(os.getpid()))
 
-    lithium = Lithium(rpc_from, rpc_to, account, contract, batch_size)
+    if store:
+        store = SqliteBlockStore(store)
+
+    lithium = Lithium(rpc_from, rpc_to, account, contract, batch_size, log_range, workers, store)
     lithium.run()
     print("Stopped")
 
+    if store:
+        store.close()
+
     if pid:
         os.unlink(pid)
+
+
+@click.command(help="Merkle proof server for transactions and events relayed by Lithium")
+@click.option('--rpc', metavar="ip:port[,...]", default='127.0.0.1:8545', help="Ethereum JSON-RPC servers of the chain being relayed")
+@click.option('--rpc-timeout', type=float, default=30, metavar="seconds", help="Time to wait for a JSON-RPC response")
+@click.option('--store', metavar="file", help="SQLite database of relayed blocks, as written by `lithium --store`")
+@click.option('--host', default='127.0.0.1', help="Address to listen on")
+@click.option('--port', type=int, default=8080, metavar="N", help="Port to listen on")
+@click.option('--workers', type=int, default=16, metavar="N", help="Handle N requests at once in each process")
+@click.option('--processes', type=int, default=1, metavar="N", help="Fork N processes, which share the listening socket")
+@click.option('--timeout', type=float, default=30, metavar="seconds", help="Time to read a request or write a response")
+@click.option('--cache-size', type=int, default=DEFAULT_PROOF_CACHE_SIZE, metavar="N", help="Keep the trees of N blocks in each process")
+@click.option('--cache-ttl', type=float, default=DEFAULT_PROOF_CACHE_TTL, metavar="seconds", help="Time the tree of a block is kept for")
+def proofserver(rpc, rpc_timeout, store, host, port, workers, processes, timeout, cache_size, cache_ttl):
+    # Flask is only needed by the proof server, not by the other commands
+    from .proofserver import serve
+
+    def make_engine():
+        # Each process has its own connections, and its own cache of blocks
+        client = arg_ethrpc(None, None, rpc)
+        client.cache = EthJsonRpcCache()
+        for node in [client] + [_.rpc for _ in getattr(client, 'nodes', [])]:
+            node.timeout = rpc_timeout
+        block_store = SqliteBlockStore(store) if store else None
+        return ProofEngine(client, block_store, cache_size, cache_ttl)
+
+    print("Serving proofs on http://%s:%d/proof/" % (host, port))
+    serve(make_engine, host, port, workers, processes, timeout)
+    print("Stopped")
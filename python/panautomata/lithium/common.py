@@ -3,16 +3,35 @@
 # SPDX-License-Identifier: LGPL-3.0+
 
 import time
-from collections import namedtuple
+import threading
+from collections import namedtuple, defaultdict, OrderedDict
 from binascii import unhexlify
+from concurrent.futures import Future
 
 from ..crypto import keccak_256
-from ..ethrpc import EthTransaction
-from ..utils import scan_bin, require, u256be, u64be, u32be, bytes_to_int
-from ..merkle import merkle_tree, merkle_path, merkle_proof
+from ..ethrpc import EthTransaction, EthJsonRpcError
+from ..utils import scan_bin, require, u256be, u64be, u32be, bytes_to_int, pack_u256_array, unpack_u256_array, pack_u32_array, unpack_u32_array
+from ..merkle import merkle_leaf_hash, merkle_path_by_index, merkle_proof, merkle_multipath_by_index, merkle_multiproof, MerkleAccumulator
 
 
-Block = namedtuple('Block', ('height', 'root', 'hash', 'items'))
+# The hashes of the transactions which have leaves, in the same order as their items
+Block = namedtuple('Block', ('height', 'root', 'hash', 'items', 'tx_hashes'))
+
+# Position of a transaction or event within the tree of a block, `log_idx`
+# is None for the transaction itself
+LeafRef = namedtuple('LeafRef', ('height', 'tx_index', 'log_idx', 'leaf_index', 'leaf'))
+
+# Maximum number of blocks requested by a single eth_getLogs
+DEFAULT_LOG_RANGE = 1000
+
+# Number of blocks a `ProofEngine` keeps the trees of
+DEFAULT_PROOF_CACHE_SIZE = 64
+
+# Seconds a `ProofEngine` keeps the tree of a block for
+DEFAULT_PROOF_CACHE_TTL = 600
+
+# Errors for which a proof can't be made, as opposed to bugs
+PROOF_ERRORS = (RuntimeError, EthJsonRpcError)
 
 
 def leaf_prefix(txn_or_log, log_idx=None):
@@ -115,116 +134,551 @@ def process_logs(rpc, tx_hash):
     return items, log_count
 
 
-def process_transaction(rpc, tx_hash):
-    transaction = rpc.eth_getTransactionByHash(tx_hash)
-    require(transaction is not None, "Transaction is None")
+def pack_transaction(transaction):
+    """
+    Returns the merkle leaf for a transaction, or None if it has no leaf
+    """
     # Exclude contract creation
     if transaction['to'] is None or transaction['to'] == '0x0':
         return None
     return pack_txn(transaction)
 
 
+def process_transaction(rpc, tx_hash):
+    """
+    Returns the merkle leaf for a transaction, given its hash or the
+    transaction object if it has already been retrieved
+    """
+    if isinstance(tx_hash, dict):
+        transaction = tx_hash
+    else:
+        transaction = rpc.eth_getTransactionByHash(tx_hash)
+    require(transaction is not None, "Transaction is None")
+    return pack_transaction(transaction)
+
+
 def process_transaction_and_logs(rpc, tx_hash):
     """
     For a given transaction, return the tx and its events/logs as merkle leafs
+
+    Either the transaction hash or the transaction object can be provided.
     """
     transaction = process_transaction(rpc, tx_hash)
     if not transaction:
         return None, 0
     items = [transaction]
 
+    if isinstance(tx_hash, dict):
+        tx_hash = tx_hash['hash']
     log_items, log_count = process_logs(rpc, tx_hash)
     items += log_items
     return items, log_count
 
 
-def process_block(rpc, block_height):
-    """Returns all items within the block"""
-    block = rpc.eth_getBlockByNumber(block_height, False)
+def make_block(block_height, block, tx_items_list):
+    """
+    Returns the `Block` and its transaction and log counts, given the hash and
+    items of each transaction in the order they appear in the block.
+    Transactions without items are skipped, e.g. contract creation.
 
+    The items are hashed as `tx_items_list` is iterated, so a generator lets
+    hashing overlap with retrieving the rest of the block.
+    """
+    block, _, tx_count, log_count = make_block_tree(block_height, block, tx_items_list)
+    return block, tx_count, log_count
+
+
+def make_block_tree(block_height, block, tx_items_list):
+    """
+    Same as `make_block`, but also returns the merkle tree of the block:
+    Block, MerkleTree, tx_count, log_count
+    """
     log_count = 0
     tx_count = 0
     items = []
+    tx_hashes = []
+    accumulator = MerkleAccumulator()
 
-    for tx_hash in block['transactions']:
-        tx_items, tx_log_count = process_transaction_and_logs(rpc, tx_hash)
+    for tx_hash, tx_items, tx_log_count in tx_items_list:
         if not tx_items:
-            # Some transactions result in no leaves, e.g. contract creation
             continue
         items += tx_items
+        tx_hashes.append(tx_hash)
+        accumulator.extend(tx_items)
         tx_count += 1
         log_count += tx_log_count
 
-    _, merkle_root = merkle_tree(items)
+    tree, merkle_root = accumulator.finalize()
 
     block_hash = bytes_to_int(unhexlify(block['hash'][2:]))
 
-    return Block(block_height, merkle_root, block_hash, items), tx_count, log_count
+    return Block(block_height, merkle_root, block_hash, items, tx_hashes), tree, tx_count, log_count
 
 
-def proof_for_event(rpc, tx_hash, log_idx):
-    if isinstance(tx_hash, EthTransaction):
-        tx_hash = tx_hash.txid
+def process_block(rpc, block_height):
+    """Returns all items within the block"""
+    block, _, tx_count, log_count = process_block_tree(rpc, block_height)
+    return block, tx_count, log_count
 
-    # XXX: super messy, very inefficient
-    tx_items, tx_log_count = process_transaction_and_logs(rpc, tx_hash)
-    require(log_idx < tx_log_count, "Log index beyond log count for transaction")
 
-    transaction = rpc.eth_getTransactionByHash(tx_hash)
-    tx_block_height = int(transaction['blockNumber'], 16)
+def process_block_tree(rpc, block_height):
+    """Same as `process_block`, but also returns the merkle tree of the block"""
+    # Full transaction objects avoid retrieving each transaction separately
+    block = rpc.eth_getBlockByNumber(block_height, True)
+    tx_items_list = ((_['hash'],) + process_transaction_and_logs(rpc, _) for _ in block['transactions'])
+    return make_block_tree(block_height, block, tx_items_list)
 
-    block, tx_count, tx_log_count = process_block(rpc, tx_block_height)
 
-    tree, root = merkle_tree(block.items)
+def process_blocks(rpc, block_heights, executor):
+    """
+    Returns the same as `process_block` for every block, in the same order.
+    See `process_blocks_tree`.
+    """
+    return [(block, tx_count, log_count)
+            for block, _, tx_count, log_count in process_blocks_tree(rpc, block_heights, executor)]
 
-    # TODO: verify the merkle root matches the on-chain merkle root submitted to LithiumLink
 
-    event_leaf = tx_items[1 + log_idx]
-    proof = merkle_path(event_leaf, tree)
-    require(merkle_proof(event_leaf, proof, block.root) is True, "Cannot confirm merkle proof")
+def process_blocks_tree(rpc, block_heights, executor):
+    """
+    Returns the same as `process_block_tree` for every block, in the same order.
+
+    Blocks, then the receipts of their transactions, are retrieved by the
+    workers of `executor` concurrently, and logs are packed by the worker
+    which retrieves them. Results are assembled in order of height.
+    """
+    block_futures = [executor.submit(rpc.eth_getBlockByNumber, _, True) for _ in block_heights]
 
-    # Proof as accepted by LithiumProver instance
-    prefix = proof_prefix(transaction, log_idx)
-    return prefix + b''.join([u256be(_) for _ in proof])
+    pending = []
+    for block_height, block_future in zip(block_heights, block_futures):
+        block = block_future.result()
+        tx_futures = []
+        for transaction in block['transactions']:
+            tx_leaf = pack_transaction(transaction)
+            if tx_leaf is not None:
+                tx_futures.append((transaction['hash'], tx_leaf, executor.submit(process_logs, rpc, transaction['hash'])))
+        pending.append((block_height, block, tx_futures))
 
+    return [make_block_tree(block_height, block, _completed_tx_items(tx_futures))
+            for block_height, block, tx_futures in pending]
 
-def proof_for_tx(rpc, tx_hash):
+
+def _completed_tx_items(tx_futures):
+    """Yields the items of each transaction as its logs are retrieved"""
+    for tx_hash, tx_leaf, logs_future in tx_futures:
+        log_items, log_count = logs_future.result()
+        yield tx_hash, [tx_leaf] + log_items, log_count
+
+
+def fetch_logs(rpc, from_height, to_height, max_range=DEFAULT_LOG_RANGE):
+    """
+    Returns all logs emitted within the range of blocks, inclusive, using as
+    few `eth_getLogs` requests as possible. Ranges are split in half when
+    the node refuses to return that many results.
+    """
+    logs = []
+    ranges = [(_, min(_ + max_range - 1, to_height)) for _ in range(from_height, to_height + 1, max_range)]
+    while ranges:
+        start, end = ranges.pop(0)
+        try:
+            logs += rpc.eth_getLogs({'fromBlock': hex(start), 'toBlock': hex(end)})
+        except EthJsonRpcError:
+            if start == end:
+                raise
+            middle = (start + end) // 2
+            ranges = [(start, middle), (middle + 1, end)] + ranges
+    return logs
+
+
+def process_block_range(rpc, from_height, to_height, max_range=DEFAULT_LOG_RANGE, executor=None):
+    """Same as `process_block_range_tree`, without the merkle trees"""
+    return [(block, tx_count, log_count)
+            for block, _, tx_count, log_count in process_block_range_tree(rpc, from_height, to_height, max_range, executor)]
+
+
+def process_block_range_tree(rpc, from_height, to_height, max_range=DEFAULT_LOG_RANGE, executor=None):
+    """
+    Returns the same as `process_block_tree` for every block within the range,
+    inclusive. Logs for the whole range are retrieved with `eth_getLogs`
+    rather than fetching the receipt of every transaction, blocks are
+    retrieved concurrently if an `executor` is provided.
+    """
+    logs_by_tx = defaultdict(list)
+    for log in fetch_logs(rpc, from_height, to_height, max_range):
+        if log.get('removed'):
+            continue
+        logs_by_tx[(int(log['blockNumber'], 16), int(log['transactionIndex'], 16))].append(log)
+
+    block_heights = list(range(from_height, to_height + 1))
+    if executor is None:
+        blocks = [rpc.eth_getBlockByNumber(_, True) for _ in block_heights]
+    else:
+        blocks = executor.map(lambda _: rpc.eth_getBlockByNumber(_, True), block_heights)
+
+    results = []
+    for block_height, block in zip(block_heights, blocks):
+        tx_items_list = []
+        for transaction in block['transactions']:
+            tx_leaf = pack_transaction(transaction)
+            if tx_leaf is None:
+                continue
+            tx_logs = logs_by_tx.get((block_height, int(transaction['transactionIndex'], 16)), [])
+            tx_logs.sort(key=lambda _: int(_['logIndex'], 16))
+            require(all([_['blockHash'] == block['hash'] for _ in tx_logs]), "Block hash of logs differ, re-organisation?")
+            tx_items_list.append((transaction['hash'], [tx_leaf] + [pack_log(_) for _ in tx_logs], len(tx_logs)))
+        results.append(make_block_tree(block_height, block, tx_items_list))
+
+    return results
+
+
+def tx_key(tx_hash):
+    """Normalised hash of a transaction, given its hash or an `EthTransaction`"""
     if isinstance(tx_hash, EthTransaction):
         tx_hash = tx_hash.txid
+    tx_hash = str(tx_hash).lower()
+    if tx_hash[:2] != '0x':
+        tx_hash = '0x' + tx_hash
+    return tx_hash
 
-    # XXX: super messy, very inefficient
-    tx_leaf = process_transaction(rpc, tx_hash)
 
-    transaction = rpc.eth_getTransactionByHash(tx_hash)
-    tx_block_height = int(transaction['blockNumber'], 16)
+def block_refs(block, tree):
+    """
+    Returns `(tx_hash, LeafRef)` for every item of the block, the items of
+    each transaction begin with its own leaf followed by those of its logs.
+    """
+    tx_hashes = iter(block.tx_hashes)
+    tx_index = tx_hash = log_idx = None
+    refs = []
+    for item in block.items:
+        item_tx_index = bytes_to_int(item[32:36])
+        if item_tx_index != tx_index:
+            tx_index, tx_hash, log_idx = item_tx_index, tx_key(next(tx_hashes)), None
+        else:
+            log_idx = 0 if log_idx is None else log_idx + 1
+        leaf_index = tree.leaf_index(merkle_leaf_hash(item))
+        refs.append((tx_hash, LeafRef(block.height, tx_index, log_idx, leaf_index, item)))
+    return refs
+
+
+class ProofEngine(object):
+    """
+    Creates proofs for transactions and events
 
-    block, tx_count, tx_log_count = process_block(rpc, tx_block_height)
+    The most recently used blocks are kept with their trees and the position
+    of every leaf, so each block is retrieved and hashed at most once however
+    many proofs are made from it. Blocks in the `store`, if any, are never
+    retrieved from the RPC server.
 
-    tree, root = merkle_tree(block.items)
+    Concurrent requests for the same block wait for a single retrieval, and
+    blocks are forgotten `ttl` seconds after being retrieved, if it isn't None.
+    """
+    def __init__(self, rpc, store=None, cache_size=DEFAULT_PROOF_CACHE_SIZE, ttl=DEFAULT_PROOF_CACHE_TTL):
+        self.rpc = rpc
+        self.store = store
+        self.cache_size = cache_size
+        self.ttl = ttl
+        # Height -> (tree, refs by key or None, expiry time, block hash), in order of use
+        self._blocks = OrderedDict()
+        self._refs = dict()
+        # Height -> Future, of blocks being retrieved
+        self._loading = dict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def _entry(self, height):
+        """Cache entry of a block, if it hasn't expired, must hold the lock"""
+        entry = self._blocks.get(height)
+        if entry is None:
+            return None
+        if entry[2] is not None and entry[2] <= time.time():
+            self._evict(height)
+            return None
+        self._blocks.move_to_end(height)
+        return entry
+
+    def _cached_ref(self, key):
+        with self._lock:
+            ref = self._refs.get(key)
+            if ref is None or self._entry(ref.height) is None:
+                return None
+            return ref
+
+    def _cached_tree(self, height):
+        with self._lock:
+            entry = self._entry(height)
+            return entry[0] if entry is not None else None
+
+    def _cache(self, height, tree, refs, block_hash=None):
+        with self._lock:
+            self._evict(height)
+            expires = time.time() + self.ttl if self.ttl is not None else None
+            self._blocks[height] = (tree, refs, expires, block_hash)
+            if refs:
+                self._refs.update(refs)
+            while len(self._blocks) > self.cache_size:
+                self._evict(next(iter(self._blocks)))
+
+    def _evict(self, height):
+        entry = self._blocks.pop(height, None)
+        if entry is None or not entry[1]:
+            return
+        for key in entry[1]:
+            if key in self._refs and self._refs[key].height == height:
+                del self._refs[key]
+
+    def _load_block(self, height, block_hash=None):
+        """
+        Retrieve and hash a block, returns its tree and the ref of every leaf
+        by key. A cached block is used, unless its hash differs, e.g. after a
+        re-organisation. If another thread is retrieving the block its result
+        is shared.
+
+        The block retrieved must have the `block_hash`, if given, otherwise
+        the transaction isn't in the block at that height any more.
+        """
+        with self._lock:
+            entry = self._entry(height)
+            if entry is not None and entry[1] is not None and block_hash in (None, entry[3]):
+                return entry[0], entry[1]
+            future = self._loading.get(height)
+            owner = future is None
+            if owner:
+                future = self._loading[height] = Future()
+
+        if owner:
+            try:
+                block, tree, _, _ = process_block_tree(self.rpc, height)
+                refs = dict([((tx_hash, ref.log_idx), ref) for tx_hash, ref in block_refs(block, tree)])
+                # Cached before others stop waiting, so they find it rather than retrieving it again
+                self._cache(height, tree, refs, block.hash)
+                future.set_result((tree, refs, block.hash))
+            except BaseException as ex:
+                future.set_exception(ex)
+                raise
+            finally:
+                with self._lock:
+                    del self._loading[height]
+
+        tree, refs, loaded_hash = future.result()
+        require(block_hash in (None, loaded_hash), "Block hash differs from the transaction's, re-organisation?")
+        return tree, refs
+
+    def _lookup(self, key):
+        """Returns the `LeafRef` for a key if it's known without the RPC server, or None"""
+        ref = self._cached_ref(key)
+        if ref is None and self.store is not None:
+            ref = self.store.lookup(*key)
+        return ref
+
+    def _tree(self, height):
+        """Returns the tree of a block if it's known without the RPC server, or None"""
+        tree = self._cached_tree(height)
+        if tree is None and self.store is not None:
+            tree = self.store.tree(height)
+            if tree is not None:
+                self._cache(height, tree, None)
+        return tree
+
+    def _transaction_block(self, tx_hash):
+        """Height and hash of the block a transaction is in"""
+        transaction = self.rpc.eth_getTransactionByHash(tx_hash)
+        require(transaction is not None, "Transaction is None")
+        require(transaction['blockNumber'] is not None, "Transaction is pending")
+        return int(transaction['blockNumber'], 16), bytes_to_int(unhexlify(transaction['blockHash'][2:]))
+
+    def _check_unknown(self, key):
+        """
+        An event which isn't known although its transaction is doesn't exist,
+        retrieving the block again wouldn't find it.
+        """
+        if key[1] is not None:
+            require(self._lookup((key[0], None)) is None, "Log index beyond log count for transaction")
+
+    def _stored(self, height, block_hash):
+        """True if the block is in the store, so its leaves are all known"""
+        if self.store is None:
+            return False
+        block = self.store.get(height)
+        return block is not None and block.hash == block_hash
+
+    @staticmethod
+    def _block_ref(refs, key):
+        ref = refs.get(key)
+        if ref is None:
+            require((key[0], None) in refs, "Transaction has no leaf")
+            require(False, "Log index beyond log count for transaction")
+        return ref
+
+    def resolve(self, tx_hash, log_idx=None):
+        """
+        Returns the `LeafRef` and tree of a transaction, or one of its events,
+        retrieving its block if it isn't already known.
+        """
+        key = (tx_key(tx_hash), log_idx)
+        ref = self._lookup(key)
+        if ref is not None:
+            tree = self._tree(ref.height)
+            if tree is not None:
+                return ref, tree
+
+        self._check_unknown(key)
+        height, block_hash = self._transaction_block(key[0])
+        require(not self._stored(height, block_hash), "Transaction has no leaf")
+        tree, refs = self._load_block(height, block_hash)
+        return self._block_ref(refs, key), tree
+
+    @staticmethod
+    def _proof(ref, tree):
+        proof = merkle_path_by_index(ref.leaf_index, tree)
+        require(merkle_proof(ref.leaf, proof, tree.root) is True, "Cannot confirm merkle proof")
+
+        # Proof as accepted by LithiumProver instance
+        prefix = u64be(ref.height) + u32be(ref.tx_index) + u32be(ref.log_idx or 0)
+        return prefix + pack_u256_array(proof)
+
+    def prove(self, tx_hash, log_idx=None):
+        """Proof of a transaction, or one of its events when `log_idx` is given"""
+        return self._proof(*self.resolve(tx_hash, log_idx))
+
+    def prove_tx(self, tx_hash):
+        return self.prove(tx_hash)
+
+    def prove_event(self, tx_hash, log_idx):
+        require(log_idx is not None and log_idx >= 0, "Invalid log index")
+        return self.prove(tx_hash, log_idx)
+
+    def iter_proofs(self, refs):
+        """
+        Yields `(idx, proof)` for each of many `(tx_hash, log_idx)` refs, where
+        `log_idx` is None to prove the transaction itself. Proofs are grouped
+        by block rather than in order, so each block is retrieved at most once.
+        If a proof can't be made the exception is yielded instead.
+        """
+        known = defaultdict(list)
+        unknown = defaultdict(list)
+        for idx, (tx_hash, log_idx) in enumerate(refs):
+            key = (tx_key(tx_hash), log_idx)
+            ref = self._lookup(key)
+            if ref is not None:
+                known[ref.height].append((idx, key, ref))
+                continue
+            try:
+                self._check_unknown(key)
+                unknown[self._transaction_block(key[0])].append((idx, key))
+            except PROOF_ERRORS as ex:
+                yield idx, ex
+
+        for height, group in known.items():
+            tree = self._tree(height)
+            if tree is None:
+                # Evicted since the refs were found
+                unknown[(height, None)] += [(idx, key) for idx, key, _ in group]
+                continue
+            for idx, key, ref in group:
+                try:
+                    yield idx, self._proof(ref, tree)
+                except PROOF_ERRORS as ex:
+                    yield idx, ex
+
+        for (height, block_hash), group in unknown.items():
+            try:
+                require(not self._stored(height, block_hash), "Transaction has no leaf")
+                tree, refs = self._load_block(height, block_hash)
+            except PROOF_ERRORS as ex:
+                for idx, _ in group:
+                    yield idx, ex
+                continue
+            for idx, key in group:
+                try:
+                    yield idx, self._proof(self._block_ref(refs, key), tree)
+                except PROOF_ERRORS as ex:
+                    yield idx, ex
+
+    def prove_many(self, refs):
+        """
+        Separate proofs for many refs, in the same order, see `iter_proofs`.
+        Raises the first error, if any proof can't be made.
+        """
+        proofs = [None] * len(refs)
+        for idx, proof in self.iter_proofs(refs):
+            if isinstance(proof, Exception):
+                raise proof
+            proofs[idx] = proof
+        return proofs
+
+    def multiproof(self, refs):
+        """Combined proof for many refs from the same block, see `multiproof_for`"""
+        require(len(refs) > 0, "Nothing to prove")
+        resolved = [self.resolve(tx_hash, log_idx) for tx_hash, log_idx in refs]
+        leaf_refs = [_[0] for _ in resolved]
+        block_height = leaf_refs[0].height
+        require(all([_.height == block_height for _ in leaf_refs]), "Transactions must be from the same block")
+
+        tree = resolved[0][1]
+        leaves = [_.leaf for _ in leaf_refs]
+        indices = [_.leaf_index for _ in leaf_refs]
+        path = merkle_multipath_by_index(indices, tree)
+        require(merkle_multiproof(leaves, indices, path, tree.root) is True, "Cannot confirm merkle proof")
+
+        return b''.join([
+            u64be(block_height),
+            u32be(len(leaves)),
+            pack_u32_array([_ for ref in leaf_refs for _ in (ref.tx_index, ref.log_idx or 0, ref.leaf_index)]),
+            pack_u256_array(path)])
+
+
+def proof_for_event(rpc, tx_hash, log_idx, store=None):
+    return ProofEngine(rpc, store).prove_event(tx_hash, log_idx)
+
+
+def proof_for_tx(rpc, tx_hash, store=None):
+    return ProofEngine(rpc, store).prove_tx(tx_hash)
+
+
+def multiproof_for(rpc, refs, store=None):
+    """
+    Combined proof for many transactions and events from the same block
 
-    # TODO: verify the merkle root matches the on-chain merkle root submitted to LithiumLink
+    Each ref is `(tx_hash, log_idx)`, where `log_idx` is None to prove the
+    transaction itself rather than one of its events. The proof is:
 
-    proof = merkle_path(tx_leaf, tree)
-    require(merkle_proof(tx_leaf, proof, block.root) is True, "Cannot confirm merkle proof")
+        block-height || count || (tx-index || log-idx || leaf-index)[count] || path
 
-    # Proof as accepted by LithiumProver instance
-    prefix = proof_prefix(transaction)
-    return prefix + b''.join([u256be(_) for _ in proof])
+    Where the block height is 8 bytes, count, tx index, log index and leaf
+    index are 4 bytes each, and the path is a list of 32 byte nodes shared
+    by all the leaves.
+    """
+    return ProofEngine(rpc, store).multiproof(refs)
 
 
 def verify_proof(root, leaf, proof):
     # Prefix is 16 bytes
     require((len(proof) - 16) % 32 == 0)
     require((len(proof) - 16) >= 32)
-    proof = proof[16:]
-    path = []
-    while proof:
-        path.append(bytes_to_int(proof[:32]))
-        proof = proof[32:]
-
+    path = unpack_u256_array(memoryview(proof)[16:])
     return merkle_proof(leaf, path, root)
 
 
+def verify_multiproof(root, leaves, proof):
+    """
+    Verify a proof created by `multiproof_for`, the leaves must be in the
+    same order as the refs the proof was created for.
+    """
+    require(len(proof) >= 12)
+    count = bytes_to_int(proof[8:12])
+    require(count == len(leaves), "Leaf count mismatch")
+    offset = 12 + (count * 12)
+    require(len(proof) >= offset)
+    require((len(proof) - offset) % 32 == 0)
+
+    proof = memoryview(proof)
+    indices = unpack_u32_array(proof[12:offset])[2::3]
+    path = unpack_u256_array(proof[offset:])
+
+    return merkle_multiproof(leaves, indices, path, root)
+
+
 def link_wait(link_contract, proof, interval=1):
     """
     Wait for the LithiumLink contract to reach the height required
@@ -16,12 +16,13 @@ instances must be initialised.
 
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # TODO: import logging, use logging
 
 from ..utils import require
 
-from .common import process_block
+from .common import process_block_tree, process_blocks_tree, process_block_range_tree
 
 
 class Lithium(object):
@@ -29,11 +30,16 @@ class Lithium(object):
     Process logs and transactions from the `rpc_from` chain, condensing them into merkle roots
     then relays them to the LithiumLink contract on the `rpc_to` chain.
     """
-    def __init__(self, rpc_from, rpc_to, to_account, link_addr, batch_size):
+    def __init__(self, rpc_from, rpc_to, to_account, link_addr, batch_size, log_range=False, workers=1, store=None):
         assert isinstance(batch_size, int)
         self._run_event = threading.Event()
         self._rpc_from = rpc_from
         self._batch_size = batch_size
+        self._log_range = log_range
+        # Blocks and receipts are retrieved concurrently when there are many workers
+        self._executor = ThreadPoolExecutor(workers) if workers > 1 else None
+        # Relayed blocks are kept, so proofs can be made without retrieving them again
+        self._store = store
         # XXX: extract ABI from package resources
         self.contract = rpc_to.proxy("../solidity/build/contracts/LithiumLink.json", link_addr, to_account)
 
@@ -44,18 +50,27 @@ class Lithium(object):
     def process_block_group(self, block_group):
         """
         Process a group of blocks, returning the packed events and transactions
+        of each block, and its merkle tree
         """
         print("Processing block group")
         out_blocks = []
+        out_trees = []
         group_tx_count = 0
         group_log_count = 0
-        for block_height in block_group:
-            block, tx_count, log_count = process_block(self._rpc_from, block_height)
+        if self._log_range:
+            # Logs for the whole group are retrieved at once, block group is consecutive
+            results = process_block_range_tree(self._rpc_from, block_group[0], block_group[-1], executor=self._executor)
+        elif self._executor is not None:
+            results = process_blocks_tree(self._rpc_from, block_group, self._executor)
+        else:
+            results = [process_block_tree(self._rpc_from, _) for _ in block_group]
+        for block, tree, tx_count, log_count in results:
             out_blocks.append(block)
+            out_trees.append(tree)
             group_tx_count += tx_count
             group_log_count += log_count
 
-        return out_blocks, group_tx_count, group_log_count
+        return out_blocks, out_trees, group_tx_count, group_log_count
 
     def get_block_group(self):
         """
@@ -94,8 +109,8 @@ class Lithium(object):
             except KeyboardInterrupt:
                 break
 
-    def submit(self, batch):
-        """Submit batch of merkle roots to LithiumLink"""
+    def submit(self, batch, trees=None):
+        """Submit batch of merkle roots to LithiumLink, `trees` of the blocks are kept in the store"""
         print("Submitting batch of", len(batch), "blocks")
         for block in batch:
             print(" -", block.height, block.root, block.hash)
@@ -124,6 +139,10 @@ class Lithium(object):
         onchain_root = self.contract.GetMerkleRoot(onchain_height)
         require(onchain_root == newest_block.root, "Root mismatch")
 
+        if self._store is not None:
+            for block, tree in zip(batch, trees or [None] * len(batch)):
+                self._store.put(block, tree)
+
         # XXX: what happens when gas limit gets hit? (e.g. too many block submitted at once)
 
     def run(self):
@@ -132,16 +151,23 @@ class Lithium(object):
         self._run_event.set()
 
         items = list()
-
-        for block_group in self.iter_blocks():
-            items, group_tx_count, group_log_count = self.process_block_group(block_group)
-            print("blocks %d-%d (%d tx, %d events)" % (min(block_group), max(block_group), group_tx_count, group_log_count))
-            self.submit(items)
-            items = []
-
-        # Submit any remaining items
-        if items:
-            self.submit(items)
+        trees = list()
+
+        try:
+            for block_group in self.iter_blocks():
+                items, trees, group_tx_count, group_log_count = self.process_block_group(block_group)
+                print("blocks %d-%d (%d tx, %d events)" % (min(block_group), max(block_group), group_tx_count, group_log_count))
+                self.submit(items, trees)
+                items = []
+                trees = []
+
+            # Submit any remaining items
+            if items:
+                self.submit(items, trees)
+        finally:
+            # Only once the last block group has been processed
+            if self._executor is not None:
+                self._executor.shutdown()
 
         if self.running:
             self._run_event.clear()
@@ -1,43 +1,262 @@
+import os
 import sys
+import json
+import signal
+import threading
 from binascii import hexlify
+from concurrent.futures import ThreadPoolExecutor
 
-from flask import Flask, Blueprint, jsonify
+from flask import Flask, Blueprint, Response, jsonify, request
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
 
+from ..args import arg_bytes32
 from ..ethrpc import EthJsonRpc
-from ..webutils import Bytes32Converter
+from ..rpccache import EthJsonRpcCache
+from ..webutils import Bytes32Converter, api_abort
 
-from .common import proof_for_event, proof_for_tx
+from .common import ProofEngine
+from .store import SqliteBlockStore
+
+
+# Maximum number of proofs requested at once
+MAX_BATCH_SIZE = 1000
+
+# Batches with more proofs than this are streamed as each block is processed
+STREAM_THRESHOLD = 50
+
+# Requests handled at once by each process
+DEFAULT_WORKERS = 16
+
+# Seconds to read a request or write a response
+DEFAULT_TIMEOUT = 30
+
+# Connections accepted for each worker, including the one it's handling
+CONNECTIONS_PER_WORKER = 4
+
+SERVICE_UNAVAILABLE = b'HTTP/1.0 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+
+
+def _batch_refs(entries):
+    """
+    Parses the body of a batch request, a list where each entry is either a
+    transaction id or a pair of transaction id and log index.
+    """
+    if not isinstance(entries, list):
+        return api_abort("Expected list of proofs")
+    if len(entries) > MAX_BATCH_SIZE:
+        return api_abort("At most %d proofs per request" % (MAX_BATCH_SIZE,))
+    refs = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = [entry]
+        if not isinstance(entry, list) or len(entry) not in (1, 2):
+            return api_abort("Invalid entry: " + json.dumps(entry))
+        tx_id, log_idx = (entry + [None])[:2]
+        try:
+            tx_id = '0x' + hexlify(arg_bytes32(None, None, tx_id)).decode('ascii')
+        except Exception:
+            return api_abort("Invalid transaction id: " + json.dumps(entry))
+        if log_idx is not None and (not isinstance(log_idx, int) or isinstance(log_idx, bool) or log_idx < 0):
+            return api_abort("Invalid log index: " + json.dumps(entry))
+        refs.append((tx_id, log_idx))
+    return refs
+
+
+def _batch_result(idx, ref, proof):
+    result = dict(index=idx, tx=ref[0], log_idx=ref[1])
+    if isinstance(proof, Exception):
+        result['error'] = str(proof)
+    else:
+        result['proof'] = hexlify(proof).decode('ascii')
+    return result
 
 
 class ProofBlueprint(Blueprint):
-    def __init__(self, rpc, **kwa):
-        super().__init__(self, 'proof', __name__, **kwa)
-        assert isinstance(rpc, EthJsonRpc)
-        self._rpc = rpc
+    """
+    Proofs of transactions and events, made by the `engine` or from the RPC
+    client and store if no engine is given.
+    """
+    def __init__(self, rpc=None, store=None, engine=None, **kwa):
+        super().__init__('proof', __name__, **kwa)
+        if engine is None:
+            assert isinstance(rpc, EthJsonRpc)
+            engine = ProofEngine(rpc, store)
+        # Shared by all requests, so blocks are only retrieved once
+        self._engine = engine
 
         self.record(lambda s: s.app.url_map.converters.__setitem__('bytes32', Bytes32Converter))
 
         self.add_url_rule('/<bytes32:tx_id>', 'tx_proof', self.tx_proof, methods=['GET'])
         self.add_url_rule('/<bytes32:tx_id>/<int:log_idx>', 'event_proof', self.event_proof, methods=['GET'])
+        self.add_url_rule('/', 'batch_proof', self.batch_proof, methods=['POST'])
 
     def tx_proof(self, tx_id):
-        proof = proof_for_tx(self._rpc, '0x' + tx_id)
+        proof = self._engine.prove_tx('0x' + tx_id)
         return jsonify(dict(proof=hexlify(proof).decode('ascii')))
 
     def event_proof(self, tx_id, log_idx):
-        proof = proof_for_event(self._rpc, '0x' + tx_id, log_idx)
+        proof = self._engine.prove_event('0x' + tx_id, log_idx)
         return jsonify(dict(proof=hexlify(proof).decode('ascii')))
 
+    def batch_proof(self):
+        """
+        Proofs for many transactions and events, each block is processed
+        once however many of the proofs are from it. Each result has the
+        index of its entry in the request, and either a proof or an error.
+
+        Large batches are streamed as the proofs for each block are made,
+        so results aren't in the same order as the request.
+        """
+        refs = _batch_refs(request.get_json(force=True, silent=True))
+        results = self._engine.iter_proofs(refs)
+
+        if len(refs) <= STREAM_THRESHOLD:
+            proofs = [None] * len(refs)
+            for idx, proof in results:
+                proofs[idx] = _batch_result(idx, refs[idx], proof)
+            return jsonify(dict(proofs=proofs))
+
+        def generate():
+            yield '{"proofs": ['
+            for count, (idx, proof) in enumerate(results):
+                yield (', ' if count else '') + json.dumps(_batch_result(idx, refs[idx], proof))
+            yield ']}'
+        return Response(generate(), mimetype='application/json')
+
+
+class ProofRequestHandler(WSGIRequestHandler):
+    """
+    Handles a single request per connection, so idle connections never hold
+    a worker. Reading the request, and writing the response, must not take
+    longer than `timeout` seconds.
+    """
+    protocol_version = 'HTTP/1.0'
+
+    def setup(self):
+        self.timeout = self.server.request_timeout
+        super().setup()
 
-def main(rpc=None):
-    if rpc is None:
-        rpc = EthJsonRpc()
 
-    proof_bp = ProofBlueprint(rpc)
+class ProofServer(BaseWSGIServer):
+    """
+    HTTP server with a fixed pool of worker threads, each connection is
+    handled by a worker so a slow request doesn't delay any others, and at
+    most `workers` requests are handled at once.
 
+    At most `max_connections` are accepted but not yet finished, those
+    beyond it are refused with a 503 rather than queued without limit.
+
+    The app may be set after the server is created, e.g. by `serve` in each
+    process.
+    """
+    multithread = True
+
+    def __init__(self, host, port, app=None, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, fd=None,
+                 max_connections=None):
+        super().__init__(host, port, app, ProofRequestHandler, fd=fd)
+        self.workers = workers
+        self.request_timeout = timeout
+        if max_connections is None:
+            max_connections = workers * CONNECTIONS_PER_WORKER
+        self._connections = threading.BoundedSemaphore(max_connections)
+        self._executor = None
+
+    def process_request(self, request, client_address):
+        if not self._connections.acquire(blocking=False):
+            self._refuse(request)
+            return
+        # Created upon the first request, as threads don't survive a fork
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers)
+        try:
+            self._executor.submit(self._process_request, request, client_address)
+        except Exception:
+            self._connections.release()
+            raise
+
+    def _refuse(self, request):
+        try:
+            request.settimeout(1)
+            request.sendall(SERVICE_UNAVAILABLE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._connections.release()
+
+    def server_close(self):
+        super().server_close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+def make_app(engine):
+    """Flask app serving proofs made by the engine under `/proof`"""
     app = Flask(__name__)
-    app.register_blueprint(proof_bp, url_prefix='/proof')
+    app.register_blueprint(ProofBlueprint(engine=engine), url_prefix='/proof')
+    return app
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(make_engine, host, port, workers=DEFAULT_WORKERS, processes=1, timeout=DEFAULT_TIMEOUT):
+    """
+    Serve proofs until interrupted, with `workers` threads in each process.
+
+    If there are many processes, they're forked after the server starts
+    listening and share its socket. Each process calls `make_engine` for
+    its own `ProofEngine`, so connections to the RPC server and the store
+    aren't shared between processes.
+    """
+    server = ProofServer(host, port, None, workers, timeout)
+    if processes <= 1:
+        server.app = make_app(make_engine())
+        server.serve_forever()
+        return
+
+    # Processes race to accept each connection, those which lose continue
+    server.socket.setblocking(False)
+    children = []
+    for _ in range(0, processes):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                server.app = make_app(make_engine())
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    # Stopped by a process manager, or interrupted, the children are stopped too
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        while children:
+            os.waitpid(children[0], 0)
+            children.pop(0)
+    except KeyboardInterrupt:
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+    finally:
+        server.server_close()
+
+
+def main(rpc=None, store=None):
+    if rpc is None:
+        rpc = EthJsonRpc(cache=EthJsonRpcCache())
+    if isinstance(store, str):
+        store = SqliteBlockStore(store)
 
+    app = make_app(ProofEngine(rpc, store))
     app.run(use_reloader=False)
 
     return 0
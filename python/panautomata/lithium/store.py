@@ -0,0 +1,174 @@
+# Copyright (c) 2018 HarryR. All Rights Reserved.
+# SPDX-License-Identifier: LGPL-3.0+
+
+"""
+Local store of processed blocks, their merkle trees and leaves
+
+Once a block has been processed its items, tree and the position of each
+transaction and event within the tree are kept, so proofs for it can be
+created without retrieving the block again:
+
+    store = SqliteBlockStore('lithium.db')
+    store.put(block)
+    proof = proof_for_tx(rpc, tx_hash, store)
+
+The daemon writes each block to the store as it's relayed, see `--store`.
+"""
+
+import sqlite3
+import threading
+
+from ..utils import bytes_to_int, u256be
+from ..merkle import MerkleTree, merkle_tree
+
+from .common import Block, LeafRef, block_refs, tx_key
+
+
+# Size of a packed transaction or log leaf
+LEAF_SIZE = 32 + 40
+
+
+class BlockStore(object):
+    """
+    Interface of block stores, blocks are replaced by those put at the same
+    height, e.g. after a re-organisation.
+    """
+    def put(self, block, tree=None):
+        """Store a `Block`, and its tree if it's already known"""
+        raise NotImplementedError
+
+    def get(self, height):
+        """Returns the `Block` at a height, or None"""
+        raise NotImplementedError
+
+    def tree(self, height):
+        """Returns the `MerkleTree` of the block at a height, or None"""
+        raise NotImplementedError
+
+    def lookup(self, tx_hash, log_idx=None):
+        """Returns the `LeafRef` of a transaction, or one of its events, or None"""
+        raise NotImplementedError
+
+    def __contains__(self, height):
+        return self.get(height) is not None
+
+    def close(self):
+        pass
+
+
+class MemoryBlockStore(BlockStore):
+    """Keeps every block in memory"""
+    def __init__(self):
+        self._blocks = dict()
+        self._refs = dict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def put(self, block, tree=None):
+        if tree is None:
+            tree, _ = merkle_tree(block.items)
+        refs = block_refs(block, tree)
+        with self._lock:
+            self._remove(block.height)
+            keys = [(tx_hash, ref.log_idx) for tx_hash, ref in refs]
+            self._blocks[block.height] = (block, tree, keys)
+            self._refs.update(zip(keys, [_[1] for _ in refs]))
+
+    def _remove(self, height):
+        previous = self._blocks.pop(height, None)
+        if previous is None:
+            return
+        for key in previous[2]:
+            if key in self._refs and self._refs[key].height == height:
+                del self._refs[key]
+
+    def get(self, height):
+        entry = self._blocks.get(height)
+        return entry[0] if entry is not None else None
+
+    def tree(self, height):
+        entry = self._blocks.get(height)
+        return entry[1] if entry is not None else None
+
+    def lookup(self, tx_hash, log_idx=None):
+        return self._refs.get((tx_key(tx_hash), log_idx))
+
+
+class SqliteBlockStore(BlockStore):
+    """
+    Stores blocks in an SQLite database, the tree of each block is kept in
+    the format of `MerkleTree.tobytes` so it's never rebuilt.
+    """
+    def __init__(self, path=':memory:'):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute("""CREATE TABLE IF NOT EXISTS blocks (
+                height INTEGER PRIMARY KEY,
+                root BLOB NOT NULL,
+                hash BLOB NOT NULL,
+                items BLOB NOT NULL,
+                tx_hashes TEXT NOT NULL,
+                tree BLOB NOT NULL)""")
+            # The log index of a transaction itself is -1
+            self._db.execute("""CREATE TABLE IF NOT EXISTS leaves (
+                tx_hash TEXT NOT NULL,
+                log_idx INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                tx_index INTEGER NOT NULL,
+                leaf_index INTEGER NOT NULL,
+                leaf BLOB NOT NULL,
+                PRIMARY KEY (tx_hash, log_idx))""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS leaves_height ON leaves (height)")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM blocks").fetchone()[0]
+
+    def put(self, block, tree=None):
+        if tree is None:
+            tree, _ = merkle_tree(block.items)
+        refs = block_refs(block, tree)
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM leaves WHERE height = ?", (block.height,))
+            self._db.execute("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?, ?)", (
+                block.height, u256be(block.root), u256be(block.hash), b''.join(block.items),
+                ','.join(block.tx_hashes), tree.tobytes()))
+            self._db.executemany("INSERT OR REPLACE INTO leaves VALUES (?, ?, ?, ?, ?, ?)", [
+                (tx_hash, -1 if ref.log_idx is None else ref.log_idx, ref.height, ref.tx_index, ref.leaf_index, ref.leaf)
+                for tx_hash, ref in refs])
+
+    def get(self, height):
+        with self._lock:
+            row = self._db.execute("SELECT root, hash, items, tx_hashes FROM blocks WHERE height = ?", (height,)).fetchone()
+        if row is None:
+            return None
+        root, block_hash, items, tx_hashes = row
+        items = [items[_:_ + LEAF_SIZE] for _ in range(0, len(items), LEAF_SIZE)]
+        return Block(height, bytes_to_int(root), bytes_to_int(block_hash), items, tx_hashes.split(',') if tx_hashes else [])
+
+    def tree(self, height):
+        with self._lock:
+            row = self._db.execute("SELECT tree FROM blocks WHERE height = ?", (height,)).fetchone()
+        if row is None:
+            return None
+        return MerkleTree.frombytes(row[0])
+
+    def __contains__(self, height):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM blocks WHERE height = ?", (height,)).fetchone() is not None
+
+    def lookup(self, tx_hash, log_idx=None):
+        with self._lock:
+            row = self._db.execute("SELECT height, tx_index, leaf_index, leaf FROM leaves WHERE tx_hash = ? AND log_idx = ?",
+                                   (tx_key(tx_hash), -1 if log_idx is None else log_idx)).fetchone()
+        if row is None:
+            return None
+        height, tx_index, leaf_index, leaf = row
+        return LeafRef(height, tx_index, log_idx, leaf_index, bytes(leaf))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -7,17 +7,29 @@ Merkle:
 Provides an interface to produce merkle trees, proofs, etc.
 """
 
+import mmap
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, repeat
+
 from .crypto import keccak_256
-from .utils import zpad, int_to_big_endian, bit_clear, bit_test, bit_set, bytes_to_int
+from .utils import TT256, zpad, int_to_big_endian, bit_clear, bytes_to_int, require
+
+
+NODE_SIZE = 32
+
+PARALLEL_SHARD_SIZE = 1 << 12
 
 
 def serialize(v):
     """Convert to value to a hashable scalar"""
-    if isinstance(v, str):
-        return v.encode('utf-8', 'backslashreplace')
     if isinstance(v, bytes):
         return v
+    if isinstance(v, str):
+        return v.encode('utf-8', 'backslashreplace')
     if isinstance(v, int):
+        if 0 <= v < TT256:
+            return v.to_bytes(32, 'big')
         return zpad(int_to_big_endian(v), 32)
     raise NotImplementedError((v, type(v)))
 
@@ -30,6 +42,180 @@ def merkle_hash(*x):
     return bit_clear(hashs(*x), 0xFF)
 
 
+# The same as `merkle_hash`, but operating on 32 byte big-endian values
+# end to end. The MSB flag is the top bit of the first byte.
+
+
+def node_clear(node):
+    """Clears the MSB of a 32 byte node"""
+    if node[0] & 0x80:
+        return bytes((node[0] & 0x7F,)) + node[1:]
+    return node
+
+
+def node_set(node):
+    """Sets the MSB of a 32 byte node"""
+    return bytes((node[0] | 0x80,)) + node[1:]
+
+
+def node_test(node):
+    """Tests the MSB of a 32 byte node"""
+    return (node[0] & 0x80) != 0
+
+
+def to_node(v):
+    """Converts an integer, or bytes, to a 32 byte node"""
+    if isinstance(v, int):
+        return v.to_bytes(NODE_SIZE, 'big')
+    return bytes(v)
+
+
+def merkle_leaf_hash(item):
+    """Hash of an item as a 32 byte leaf, equivalent to `merkle_hash(item)`"""
+    return node_clear(keccak_256(serialize(item)).digest())
+
+
+def merkle_node_hash(data):
+    """
+    Hash of two concatenated 32 byte nodes, any buffer may be passed, e.g. a
+    memoryview over a level of the tree, equivalent to `merkle_hash(a, b)`.
+    """
+    return node_clear(keccak_256(data).digest())
+
+
+EXTRA_LEAF = merkle_leaf_hash(b"merkle-tree-extra")
+
+
+TREE_MAGIC = b'PMKT'
+
+TREE_VERSION = 1
+
+TREE_HEADER = struct.Struct('>4sLLL')
+
+
+class MerkleTree(object):
+    """
+    Compact representation of a merkle tree.
+
+    Every node is stored as a 32 byte big-endian value, all levels are kept
+    back-to-back in a single contiguous buffer. The offset of each level is
+    recorded in `_offsets` (in nodes, not bytes), with a trailing offset for
+    the end of the last level, e.g. for a tree of 4 items:
+
+        offsets:  0             4       6   7
+        buffer:  [ L0 L0 L0 L0 | L1 L1 | R ]
+
+    This avoids holding a separate arbitrary precision integer object for
+    every node of the tree.
+
+    An optional `index` maps each leaf hash to its position in the first
+    level, which avoids a scan over every leaf to find the path for an item.
+    Without an index the sorted first level is searched.
+
+    The `leaf_count` is the number of items in the first level, excluding
+    the 'extra' item which may have been appended as padding.
+
+    Trees can be serialized with `tobytes`, and read back zero-copy from any
+    buffer, e.g. an `mmap` of a file, with `frombytes`. The format is:
+
+        magic || version || leaf-count || level-count || offsets[level-count + 1] || nodes
+
+    Where the magic is 4 bytes, and the version, counts and offsets are
+    32bit big-endian integers.
+    """
+    __slots__ = ('_buf', '_offsets', '_index', 'leaf_count')
+
+    def __init__(self, buf, offsets, index=None, leaf_count=None):
+        assert len(offsets) >= 2
+        assert len(buf) == offsets[-1] * NODE_SIZE
+        self._buf = memoryview(buf)
+        self._offsets = tuple(offsets)
+        self._index = index
+        if leaf_count is None:
+            leaf_count = offsets[1]
+        self.leaf_count = leaf_count
+
+    @classmethod
+    def frombytes(cls, data):
+        """
+        Open a tree serialized by `tobytes`, the nodes aren't copied
+        """
+        data = memoryview(data)
+        require(len(data) >= TREE_HEADER.size, "Tree data too short")
+        magic, version, leaf_count, level_count = TREE_HEADER.unpack_from(data)
+        require(magic == TREE_MAGIC, "Not a merkle tree")
+        require(version == TREE_VERSION, "Unknown merkle tree version")
+        require(level_count >= 1, "Merkle tree has no levels")
+        offsets_fmt = '>%dL' % (level_count + 1,)
+        start = TREE_HEADER.size + struct.calcsize(offsets_fmt)
+        require(len(data) >= start, "Tree data too short")
+        offsets = struct.unpack_from(offsets_fmt, data, TREE_HEADER.size)
+        require(offsets[0] == 0, "Merkle tree offsets must start at zero")
+        require(all([a < b for a, b in zip(offsets, offsets[1:])]), "Merkle tree levels must not be empty")
+        require(offsets[-1] - offsets[-2] == 1, "Merkle tree must have a single root")
+        # The first level may have one extra node, as padding
+        require(leaf_count <= offsets[1] <= leaf_count + 1, "Merkle tree leaf count mismatch")
+        require(len(data) == start + (offsets[-1] * NODE_SIZE), "Tree data length mismatch")
+        return cls(data[start:], offsets, leaf_count=leaf_count)
+
+    def tobytes(self):
+        header = TREE_HEADER.pack(TREE_MAGIC, TREE_VERSION, self.leaf_count, len(self))
+        offsets = struct.pack('>%dL' % (len(self._offsets),), *self._offsets)
+        return header + offsets + self._buf.tobytes()
+
+    def __reduce__(self):
+        return (MerkleTree, (self._buf.tobytes(), self._offsets, self._index, self.leaf_count))
+
+    def __len__(self):
+        """Number of levels in the tree, including the root"""
+        return len(self._offsets) - 1
+
+    def level_size(self, level):
+        """Number of nodes in a level"""
+        return self._offsets[level + 1] - self._offsets[level]
+
+    def level(self, level):
+        """Zero-copy view of all the nodes in a level"""
+        start = self._offsets[level] * NODE_SIZE
+        end = self._offsets[level + 1] * NODE_SIZE
+        return self._buf[start:end]
+
+    def node(self, level, idx):
+        """Returns the 32 byte value of a node"""
+        if idx < 0 or idx >= self.level_size(level):
+            raise IndexError(idx)
+        start = (self._offsets[level] + idx) * NODE_SIZE
+        return self._buf[start:start + NODE_SIZE].tobytes()
+
+    def leaf_index(self, leaf_hash):
+        """
+        Position of a hashed leaf within the first level of the tree
+
+        :type leaf_hash: bytes
+        """
+        if self._index is not None:
+            try:
+                return self._index[leaf_hash]
+            except KeyError:
+                raise ValueError("Leaf not in tree")
+        # Binary search of the sorted leaves, finds the first occurrence
+        level = self.level(0)
+        low, high = 0, self.leaf_count
+        while low < high:
+            mid = (low + high) // 2
+            if level[mid * NODE_SIZE:(mid + 1) * NODE_SIZE].tobytes() < leaf_hash:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.leaf_count and level[low * NODE_SIZE:(low + 1) * NODE_SIZE] == leaf_hash:
+            return low
+        raise ValueError("Leaf not in tree")
+
+    @property
+    def root(self):
+        return int.from_bytes(self.node(len(self) - 1, 0), 'big')
+
+
 def merkle_tree(items):
     """
     Hashes a list of items, then creates a Merkle tree where the items are
@@ -48,25 +234,171 @@ def merkle_tree(items):
     The first level of items is sorted.
 
     :type items: list
-    :return: list, long
+    :return: MerkleTree, long
+    """
+    return _merkle_tree_from_hashes(list(map(merkle_leaf_hash, items)))
+
+
+def _merkle_tree_from_hashes(leaf_hashes):
+    """
+    Create a tree from a list of already hashed 32 byte leaves, see `merkle_tree`
     """
     # An empty tree results in an empty root
-    if not items:
-        return [0], 0
+    if not leaf_hashes:
+        return MerkleTree(bytes(NODE_SIZE), (0, 1), leaf_count=0), 0
+
+    leaf_hashes = sorted(leaf_hashes)
+    levels = _merkle_levels(b''.join(leaf_hashes))
+    return _merkle_tree_from_levels(leaf_hashes, levels)
 
-    tree = [sorted(map(merkle_hash, items))]
-    extra = merkle_hash(b"merkle-tree-extra")
+
+def _merkle_tree_from_levels(leaf_hashes, levels):
+    """
+    Create a tree from the sorted leaf hashes and the concatenated nodes of
+    every level, returns the tree and the root.
+    """
+    # Index of leaf hash to position, duplicates resolve to the first occurrence
+    index = dict()
+    for idx, leaf_hash in enumerate(leaf_hashes):
+        index.setdefault(leaf_hash, idx)
+
+    offsets = [0]
+    for level in levels:
+        offsets.append(offsets[-1] + (len(level) // NODE_SIZE))
+
+    tree = MerkleTree(b''.join(levels), offsets, index, len(leaf_hashes))
+    return tree, int.from_bytes(levels[-1], 'big')
+
+
+def _merkle_levels(level, depth=None):
+    """
+    Hashes the concatenated nodes of a level in pairs to create the next
+    level, until only the root remains. Or, if `depth` is given, until
+    exactly that many levels have been hashed, even if a level with a
+    single node is reached before then.
+
+    Returns a list of the concatenated nodes of every level.
+    """
+    levels = []
     while True:
-        level = tree[-1]
         # Ensure level has an even number of items, pad it with an 'extra item'
-        if len(level) % 2 != 0:
-            level.append(extra)
-        # Hash each pair in the list to create the next level
-        it = iter(level)
-        tree.append([merkle_hash(item, next(it)) for item in it])
-        if len(tree[-1]) == 1:
+        if (len(level) // NODE_SIZE) % 2 != 0:
+            level += EXTRA_LEAF
+        levels.append(level)
+        # Hash each pair in the level to create the next level
+        view = memoryview(level)
+        level = b''.join([merkle_node_hash(view[i:i + (NODE_SIZE * 2)])
+                          for i in range(0, len(level), NODE_SIZE * 2)])
+        if depth is None:
+            if len(level) == NODE_SIZE:
+                break
+        elif len(levels) == depth:
             break
-    return tree, tree[-1][0]
+    levels.append(level)
+    return levels
+
+
+def _merkle_leaf_hashes(items):
+    """Hashes items as leaves, in a worker process"""
+    return [merkle_leaf_hash(_) for _ in items]
+
+
+def merkle_tree_parallel(items, executor=None, max_workers=None, shard_size=PARALLEL_SHARD_SIZE):
+    """
+    Creates the same tree as `merkle_tree`, spreading the work across a
+    pool of processes.
+
+    The items are hashed by the workers, then the sorted leaves are split
+    into shards of `shard_size` (a power of two) leaves. Each shard is
+    a complete subtree of the whole tree, so the workers build the
+    subtrees independently and the parent process hashes the roots of
+    the shards together to form the upper levels.
+
+    Any `concurrent.futures` executor may be given, otherwise a process
+    pool of `max_workers` is created for the duration of the call.
+
+    Trees are picklable, so to build many trees at once, e.g. when catching
+    up on many blocks, `executor.map(merkle_tree, ...)` can be used instead.
+
+    :return: MerkleTree, long
+    """
+    require(shard_size >= 2 and (shard_size & (shard_size - 1)) == 0, "Shard size must be a power of two")
+    if len(items) <= shard_size:
+        return merkle_tree(items)
+
+    if executor is None:
+        with ProcessPoolExecutor(max_workers) as executor:
+            return merkle_tree_parallel(items, executor, shard_size=shard_size)
+
+    items = list(items)
+    shards = [items[i:i + shard_size] for i in range(0, len(items), shard_size)]
+    leaf_hashes = sorted(chain.from_iterable(executor.map(_merkle_leaf_hashes, shards)))
+
+    leaves = b''.join(leaf_hashes)
+    shard_bytes = shard_size * NODE_SIZE
+    depth = shard_size.bit_length() - 1
+    shards = [leaves[i:i + shard_bytes] for i in range(0, len(leaves), shard_bytes)]
+    subtrees = list(executor.map(_merkle_levels, shards, repeat(depth)))
+
+    # Every level of a full shard has an even number of nodes, so only the
+    # last shard can be padded, in the same place as the whole tree would be.
+    levels = [b''.join([_[level] for _ in subtrees]) for level in range(0, depth)]
+    levels += _merkle_levels(b''.join([_[depth] for _ in subtrees]))
+
+    return _merkle_tree_from_levels(leaf_hashes, levels)
+
+
+def merkle_tree_save(tree, filename):
+    """Write a tree to a file, see `MerkleTree.tobytes`"""
+    with open(filename, 'wb') as handle:
+        handle.write(tree.tobytes())
+
+
+def merkle_tree_open(filename):
+    """
+    Open a tree saved with `merkle_tree_save`, the file is memory mapped
+    read-only and nodes are read directly from the mapping.
+
+    :return: MerkleTree, long
+    """
+    with open(filename, 'rb') as handle:
+        data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    tree = MerkleTree.frombytes(data)
+    return tree, tree.root
+
+
+class MerkleAccumulator(object):
+    """
+    Builds a merkle tree from items which are added one at a time, e.g. as
+    they're retrieved from the RPC server, so hashing can begin before every
+    item is available. Finalizing results in the same tree as `merkle_tree`.
+
+    The first level of the tree is sorted, so the position of any leaf isn't
+    known until every leaf has been added, and nodes can't be combined early
+    without changing the root. Only the leaf hashes are kept, and the upper
+    levels of the tree are built by `finalize`.
+    """
+    __slots__ = ('_leaf_hashes',)
+
+    def __init__(self, items=None):
+        self._leaf_hashes = []
+        if items:
+            self.extend(items)
+
+    def __len__(self):
+        return len(self._leaf_hashes)
+
+    def add(self, item):
+        self._leaf_hashes.append(merkle_leaf_hash(item))
+
+    def extend(self, items):
+        self._leaf_hashes.extend(map(merkle_leaf_hash, items))
+
+    def finalize(self):
+        """
+        :return: MerkleTree, long
+        """
+        return _merkle_tree_from_hashes(self._leaf_hashes)
 
 
 def merkle_path(item, tree):
@@ -91,20 +423,155 @@ def merkle_path(item, tree):
     H(L11, H(L5, H(x)))    <- level 2 (root)
     ```
     """
-    item = merkle_hash(item)
-    # TODO handle item passed not being in list more elegantly
-    idx = tree[0].index(item)
+    return merkle_path_by_index(tree.leaf_index(merkle_leaf_hash(item)), tree)
+
+
+def merkle_path_by_index(idx, tree):
+    """
+    Return the path for the leaf at position `idx` in the first level of
+    the tree, see `merkle_path`.
+    """
+    if idx < 0 or idx >= tree.leaf_count:
+        raise IndexError(idx)
 
     path = []
-    for level in tree[:-1]:
-        if (idx % 2) == 0:
-            path.append(bit_set(level[idx + 1], 0xFF))
-        else:
-            path.append(level[idx - 1])
+    for level in range(0, len(tree) - 1):
+        path.append(_path_sibling(tree, level, idx))
         idx = idx // 2
     return path
 
 
+def _path_sibling(tree, level, idx):
+    """
+    Sibling of a node, as an item of the path, with the MSB set when the
+    sibling is on the right.
+    """
+    if (idx % 2) == 0:
+        return int.from_bytes(node_set(tree.node(level, idx + 1)), 'big')
+    return int.from_bytes(tree.node(level, idx - 1), 'big')
+
+
+def merkle_all_paths(tree):
+    """
+    Yields `(leaf_index, path)` for every leaf in the tree, in order.
+
+    Adjacent leaves share most of their path, only the levels where the
+    position of the node changes from the previous leaf are re-read from
+    the tree, so generating every path is a single pass over the tree
+    rather than a separate walk per leaf.
+    """
+    depth = len(tree) - 1
+    path = [None] * depth
+    for leaf_idx in range(0, tree.leaf_count):
+        for level in range(0, depth):
+            idx = leaf_idx >> level
+            # Upper levels are shared with the previous leaf
+            if leaf_idx and idx == ((leaf_idx - 1) >> level):
+                break
+            path[level] = _path_sibling(tree, level, idx)
+        yield leaf_idx, list(path)
+
+
+def merkle_multipath(items, tree):
+    """
+    Given a tree and a list of items, return the leaf positions and the
+    minimal path which proves all of the items exist within the root.
+
+    See `merkle_multipath_by_index`.
+
+    :return: list, list
+    """
+    indices = [tree.leaf_index(merkle_leaf_hash(_)) for _ in items]
+    return indices, merkle_multipath_by_index(indices, tree)
+
+
+def merkle_multipath_by_index(indices, tree):
+    """
+    Return a combined path for multiple leaves of the same tree.
+
+    The tree is walked a level at a time from the leaves upwards, at each
+    level the known nodes are visited in order of position. Where both a
+    node and its sibling are known they're hashed together, otherwise the
+    sibling is appended to the path. Siblings shared by many leaves are only
+    included once.
+
+    Items in the path use the same MSB left/right convention as `merkle_path`,
+    so the multi-path for a single leaf is identical to its normal path.
+    """
+    known = sorted(set(indices))
+    for idx in known:
+        if idx < 0 or idx >= tree.leaf_count:
+            raise IndexError(idx)
+
+    path = []
+    for level in range(0, len(tree) - 1):
+        next_known = []
+        i = 0
+        while i < len(known):
+            idx = known[i]
+            if (idx % 2) == 0 and (i + 1) < len(known) and known[i + 1] == idx + 1:
+                i += 2
+            else:
+                path.append(_path_sibling(tree, level, idx))
+                i += 1
+            next_known.append(idx // 2)
+        known = next_known
+    return path
+
+
+def merkle_multiproof(leaves, indices, path, root):
+    """
+    Verify a combined path for multiple leaves matches the root
+
+    The `indices` are the positions of each leaf in the first level of the
+    tree, these determine which known nodes are paired together. Items from
+    the path are consumed in the same order they were created by
+    `merkle_multipath_by_index`, and must be on the side of each node that
+    its position implies, so the indices can't be forged.
+    """
+    if not leaves or len(leaves) != len(indices):
+        return False
+
+    nodes = dict()
+    for leaf, idx in zip(leaves, indices):
+        if idx < 0:
+            return False
+        node = merkle_leaf_hash(leaf)
+        if nodes.setdefault(idx, node) != node:
+            return False
+    known = sorted(nodes.items())
+
+    path = [to_node(_) for _ in path]
+    path_idx = 0
+    while len(known) > 1 or path_idx < len(path):
+        next_known = []
+        i = 0
+        while i < len(known):
+            idx, node = known[i]
+            if (idx % 2) == 0 and (i + 1) < len(known) and known[i + 1][0] == idx + 1:
+                node = merkle_node_hash(node + known[i + 1][1])
+                i += 2
+            else:
+                if path_idx >= len(path):
+                    return False
+                item = path[path_idx]
+                path_idx += 1
+                # Siblings of even nodes are on the right
+                if node_test(item) != ((idx % 2) == 0):
+                    return False
+                if node_test(item):
+                    node = merkle_node_hash(node + node_clear(item))
+                else:
+                    node = merkle_node_hash(item + node)
+                i += 1
+            next_known.append((idx // 2, node))
+        known = next_known
+
+    # Indices beyond the depth of the path don't reach the root
+    idx, node = known[0]
+    return idx == 0 and int.from_bytes(node, 'big') == root
+
+
 def merkle_proof(leaf, path, root):
     """
     Verify Merkle path for an item matches the root
@@ -114,15 +581,14 @@ def merkle_proof(leaf, path, root):
 
         H(node, item) or H(item, node)
     """
-    node = merkle_hash(leaf)
+    node = merkle_leaf_hash(leaf)
     for item in path:
-        if isinstance(item, bytes):
-            item = bytes_to_int(item)
-        if bit_test(item, 0xFF):
-            node = merkle_hash(node, bit_clear(item, 0xFF))
+        item = to_node(item)
+        if node_test(item):
+            node = merkle_node_hash(node + node_clear(item))
         else:
-            node = merkle_hash(item, node)
-    return node == root
+            node = merkle_node_hash(item + node)
+    return int.from_bytes(node, 'big') == root
 
 
 def main():
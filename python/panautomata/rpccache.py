@@ -0,0 +1,103 @@
+# Copyright (c) 2018 HarryR. All Rights Reserved.
+# SPDX-License-Identifier: LGPL-3.0+
+
+"""
+Cache for JSON-RPC results which never change once they're final
+
+Transactions which have been mined, their receipts and blocks requested by
+hash are immutable, so repeated requests for them can be answered without
+asking the node again. Results which are pending, or which depend on the
+`latest` block, are never cached. To use, pass to the RPC client:
+
+    rpc = EthJsonRpc('127.0.0.1', 8545, cache=EthJsonRpcCache(path='rpc.cache'))
+
+Cached results are shared between callers and must not be modified.
+"""
+
+import json
+import shelve
+import threading
+from collections import OrderedDict
+
+
+DEFAULT_CACHE_SIZE = 10000
+
+
+# For each cacheable method, whether a result is final
+CACHEABLE_METHODS = {
+    # Pending transactions have no block
+    'eth_getTransactionByHash': lambda result: result.get('blockNumber') is not None,
+    'eth_getTransactionReceipt': lambda result: result.get('blockHash') is not None,
+    # Pending blocks have no hash
+    'eth_getBlockByHash': lambda result: result.get('hash') is not None,
+}
+
+
+class EthJsonRpcCache(object):
+    """
+    Size-bounded LRU cache of final results, optionally persisted to disk
+
+    The on-disk tier, if any, retains every result and is consulted when a
+    result isn't in memory.
+    """
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE, path=None):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._shelf = shelve.open(path) if path is not None else None
+
+    @staticmethod
+    def _key(method, params):
+        if method not in CACHEABLE_METHODS:
+            return None
+        return method + json.dumps(params or [])
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, method, params):
+        """Returns the cached result of the call, or None"""
+        key = self._key(method, params)
+        if key is None:
+            return None
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            elif self._shelf is not None:
+                result = self._shelf.get(key)
+                if result is not None:
+                    self._remember(key, result)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return result
+
+    def put(self, method, params, result):
+        """Caches the result of the call, if it is final"""
+        key = self._key(method, params)
+        if key is None or not isinstance(result, dict) or not CACHEABLE_METHODS[method](result):
+            return
+        with self._lock:
+            self._remember(key, result)
+            if self._shelf is not None:
+                self._shelf[key] = result
+
+    def _remember(self, key, result):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, size=len(self._entries))
+
+    def close(self):
+        with self._lock:
+            self._entries.clear()
+            if self._shelf is not None:
+                self._shelf.close()
+                self._shelf = None
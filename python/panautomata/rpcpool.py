@@ -0,0 +1,140 @@
+# Copyright (c) 2018 HarryR. All Rights Reserved.
+# SPDX-License-Identifier: LGPL-3.0+
+
+"""
+JSON-RPC client for several nodes of the same chain
+
+Reads are sent to the least-loaded healthy node, and are retried on another
+node if one fails. Writes, and methods which depend on state kept by a node
+such as filters and its pending transactions, are sent to the preferred node,
+which is the first healthy node in the order given:
+
+    rpc = EthJsonRpcPool([EthJsonRpc('10.0.0.1', 8545), EthJsonRpc('10.0.0.2', 8545)])
+
+A node which fails repeatedly is avoided for a period which increases with
+each further failure. Nodes aren't polled in the background, once the period
+has passed the node is tried again by the next request, and its failure count
+is reset when that request succeeds. Transactions sent with
+`eth_sendTransaction` aren't retried on another node, as the node may have
+received it before failing.
+"""
+
+import time
+import threading
+
+from .ethrpc import EthJsonRpc, ConnectionError, BadStatusCodeError, BadJsonError, BLOCK_TAG_PENDING
+
+
+DEFAULT_FAILURE_THRESHOLD = 3
+
+DEFAULT_COOLDOWN = 5
+
+DEFAULT_MAX_COOLDOWN = 60
+
+# Methods which are sent to the preferred node
+STICKY_METHODS = frozenset([
+    'eth_sendTransaction',
+    'eth_sendRawTransaction',
+    'eth_sign',
+    'eth_newFilter',
+    'eth_newBlockFilter',
+    'eth_newPendingTransactionFilter',
+    'eth_getFilterChanges',
+    'eth_getFilterLogs',
+    'eth_uninstallFilter',
+])
+
+# Methods which aren't retried on another node, as the first may have received it
+UNSAFE_RETRY_METHODS = frozenset([
+    'eth_sendTransaction',
+])
+
+# Errors after which the request can be sent to another node
+NODE_ERRORS = (ConnectionError, BadStatusCodeError, BadJsonError)
+
+
+def _is_sticky(request):
+    return request['method'] in STICKY_METHODS or BLOCK_TAG_PENDING in request.get('params', [])
+
+
+class PoolNode(object):
+    """An endpoint of the pool, and the state of its circuit breaker"""
+    def __init__(self, rpc):
+        self.rpc = rpc
+        self.in_flight = 0
+        self.failures = 0
+        self.open_until = 0
+
+    def __str__(self):
+        return '{}:{}'.format(self.rpc.host, self.rpc.port)
+
+    def healthy(self, now):
+        return now >= self.open_until
+
+
+class EthJsonRpcPool(EthJsonRpc):
+    """
+    Sends requests to one of many `EthJsonRpc` nodes
+    """
+    def __init__(self, nodes, cache=None, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 cooldown=DEFAULT_COOLDOWN, max_cooldown=DEFAULT_MAX_COOLDOWN):
+        assert len(nodes) > 0
+        super(EthJsonRpcPool, self).__init__(nodes[0].host, nodes[0].port, nodes[0].tls, cache=cache)
+        self.nodes = [PoolNode(_) for _ in nodes]
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def _candidates(self, sticky):
+        """
+        Nodes to try, in order. Healthy nodes are first, followed by the
+        others in the order their circuits will close.
+        """
+        now = time.time()
+        with self._lock:
+            healthy = [_ for _ in self.nodes if _.healthy(now)]
+            unhealthy = sorted([_ for _ in self.nodes if not _.healthy(now)], key=lambda _: _.open_until)
+            if not sticky and healthy:
+                # Rotate, so equally loaded nodes share the requests
+                self._next = (self._next + 1) % len(healthy)
+                healthy = healthy[self._next:] + healthy[:self._next]
+                healthy.sort(key=lambda _: _.in_flight)
+        return healthy + unhealthy
+
+    def _succeeded(self, node):
+        with self._lock:
+            node.failures = 0
+            node.open_until = 0
+
+    def _failed(self, node):
+        with self._lock:
+            node.failures += 1
+            if node.failures >= self.failure_threshold:
+                backoff = self.cooldown * (2 ** (node.failures - self.failure_threshold))
+                node.open_until = time.time() + min(backoff, self.max_cooldown)
+
+    def _post(self, data):
+        requests = data if isinstance(data, list) else [data]
+        sticky = any([_is_sticky(_) for _ in requests])
+        retry = not any([_['method'] in UNSAFE_RETRY_METHODS for _ in requests])
+        error = None
+        for node in self._candidates(sticky):
+            with self._lock:
+                node.in_flight += 1
+            try:
+                response = node.rpc._post(data)
+            except NODE_ERRORS as ex:
+                self._failed(node)
+                error = ex
+                if not retry:
+                    break
+                continue
+            else:
+                self._succeeded(node)
+                return response
+            finally:
+                with self._lock:
+                    node.in_flight -= 1
+        raise error
@@ -0,0 +1,217 @@
+# Copyright (c) 2018 HarryR. All Rights Reserved.
+# SPDX-License-Identifier: LGPL-3.0+
+
+"""
+Signs transactions locally and submits them with `eth_sendRawTransaction`
+
+Nonces are assigned locally, so many transactions from the same account can
+be in-flight at once rather than waiting for each to be mined:
+
+    sender = TransactionSender(rpc, private_key)
+    txs = [sender.send_transaction(contract, data) for data in payloads]
+    receipts = [_.wait() for _ in txs]
+
+A `TransactionSender` can also be used as the account of a contract proxy,
+`rpc.proxy(abi, address, sender)`.
+"""
+
+import threading
+from binascii import hexlify, unhexlify
+from collections import namedtuple, OrderedDict
+
+import rlp
+
+from .crypto import keccak_256, ecdsa_sign, ecdsa_address
+from .ethrpc import EthTransaction, EthJsonRpcError, BLOCK_TAG_LATEST, BLOCK_TAG_PENDING
+from .utils import normalise_address, require
+
+
+DEFAULT_MAX_PENDING = 16
+
+# Minimum gas price increase for a node to accept a replacement transaction
+REPLACEMENT_GAS_PRICE_BUMP = 1.125
+
+
+SignedTransaction = namedtuple('SignedTransaction', ('nonce', 'gas_price', 'gas', 'to', 'value', 'data', 'raw', 'txid'))
+
+
+def sign_transaction(key, nonce, gas_price, gas, to, value, data, chain_id=None):
+    """
+    Returns the RLP encoded transaction signed with the private key, the
+    signature replay protected by EIP-155 when a `chain_id` is given.
+    """
+    fields = [nonce, gas_price, gas, to, value, data]
+    if chain_id is None:
+        sighash = keccak_256(rlp.encode(fields)).digest()
+    else:
+        sighash = keccak_256(rlp.encode(fields + [chain_id, 0, 0])).digest()
+    v, r, s = ecdsa_sign(sighash, key)
+    if chain_id is not None:
+        v += 8 + (chain_id * 2)
+    return rlp.encode(fields + [v, r.lstrip(b'\0'), s.lstrip(b'\0')])
+
+
+def _is_nonce_too_low(ex):
+    # geth: 'nonce too low', parity: 'Transaction nonce is too low'
+    message = str(ex).lower()
+    return 'nonce' in message and 'low' in message
+
+
+class TransactionSender(object):
+    """
+    Local nonce manager and signer for a single account
+
+    Up to `max_pending` transactions may be unconfirmed at once. Transactions
+    which are dropped by the node are re-broadcast by `refresh`, and if the
+    submission of a transaction fails its nonce is re-used so there are no
+    gaps in the sequence of nonces.
+    """
+    def __init__(self, rpc, key, chain_id=None, gas_price=None, max_pending=DEFAULT_MAX_PENDING):
+        require(len(key) == 32, "Private key must be 32 bytes")
+        self.rpc = rpc
+        self.chain_id = chain_id
+        self.gas_price = gas_price or rpc.DEFAULT_GAS_PRICE
+        self.max_pending = max_pending
+        self.address = hexlify(ecdsa_address(key)).decode('ascii')
+        self._key = key
+        self._lock = threading.RLock()
+        self._nonce = None
+        self._free = []
+        self._pending = OrderedDict()
+
+    def __str__(self):
+        return self.address
+
+    def __len__(self):
+        return len(self._pending)
+
+    @property
+    def pending(self):
+        """Unconfirmed transactions, in nonce order"""
+        with self._lock:
+            return [self._pending[_] for _ in sorted(self._pending.keys())]
+
+    def resync(self):
+        """
+        Continue from the count of transactions known by the node, nonces
+        between it and those of our pending transactions will be re-used.
+        """
+        with self._lock:
+            self._nonce = self.rpc.eth_getTransactionCount('0x' + self.address, BLOCK_TAG_PENDING)
+            self._free = []
+            if self._pending:
+                last = max(self._pending.keys())
+                self._free = [_ for _ in range(self._nonce, last) if _ not in self._pending]
+                self._nonce = max(self._nonce, last + 1)
+
+    def _take_nonce(self):
+        if self._nonce is None:
+            self.resync()
+        if self._free:
+            return self._free.pop(0)
+        nonce = self._nonce
+        self._nonce += 1
+        return nonce
+
+    def _release_nonce(self, nonce):
+        if nonce == self._nonce - 1:
+            self._nonce = nonce
+        else:
+            self._free = sorted(self._free + [nonce])
+
+    def _submit(self, nonce, to, value, data, gas, gas_price):
+        raw = sign_transaction(self._key, nonce, gas_price, gas, to, value, data, self.chain_id)
+        txid = self.rpc.eth_sendRawTransaction('0x' + hexlify(raw).decode('ascii'))
+        signed = SignedTransaction(nonce, gas_price, gas, to, value, data, raw, txid)
+        self._pending[nonce] = signed
+        return signed
+
+    def send_transaction(self, to=None, data=b'', value=0, gas=None, gas_price=None):
+        """
+        Sign and submit a transaction, returns an `EthTransaction` without
+        waiting for it to be mined. If `max_pending` transactions are
+        unconfirmed, waits for the oldest of them first.
+        """
+        to = unhexlify(normalise_address(to)) if to is not None else b''
+        gas = gas or self.rpc.DEFAULT_GAS_PER_TX
+        gas_price = gas_price or self.gas_price
+        if len(self._pending) >= self.max_pending:
+            self._wait_slot()
+
+        with self._lock:
+            nonce = self._take_nonce()
+            try:
+                signed = self._submit(nonce, to, value, data, gas, gas_price)
+            except EthJsonRpcError as ex:
+                if not _is_nonce_too_low(ex):
+                    self._release_nonce(nonce)
+                    raise
+                # Another transaction was sent from the same account
+                self.resync()
+                nonce = self._take_nonce()
+                try:
+                    signed = self._submit(nonce, to, value, data, gas, gas_price)
+                except EthJsonRpcError:
+                    self._release_nonce(nonce)
+                    raise
+        return EthTransaction(self.rpc, signed.txid)
+
+    def replace(self, tx, gas_price=None, to=None, data=None, value=None):
+        """
+        Replace a pending transaction with one which has the same nonce, by
+        default the same transaction with a higher gas price. A transaction
+        can be cancelled by replacing it with one that sends nothing to itself.
+        """
+        txid = str(tx)
+        with self._lock:
+            previous = [_ for _ in self._pending.values() if _.txid == txid]
+            require(len(previous) == 1, "Transaction isn't pending")
+            previous = previous[0]
+            if gas_price is None:
+                gas_price = int(previous.gas_price * REPLACEMENT_GAS_PRICE_BUMP) + 1
+            to = unhexlify(normalise_address(to)) if to is not None else previous.to
+            signed = self._submit(previous.nonce, to,
+                                  previous.value if value is None else value,
+                                  previous.data if data is None else data,
+                                  previous.gas, gas_price)
+        return EthTransaction(self.rpc, signed.txid)
+
+    def refresh(self):
+        """
+        Forget transactions which have been mined, and re-broadcast any
+        pending transactions the node no longer knows about. Returns the
+        number of unconfirmed transactions.
+        """
+        mined = self.rpc.eth_getTransactionCount('0x' + self.address, BLOCK_TAG_LATEST)
+        with self._lock:
+            for nonce in [_ for _ in self._pending.keys() if _ < mined]:
+                del self._pending[nonce]
+            pending = self.pending
+        if not pending:
+            return 0
+
+        known = self.rpc._call_batch([('eth_getTransactionByHash', [_.txid]) for _ in pending])
+        for signed, result in zip(pending, known):
+            if result.exception() is not None or result.result() is not None:
+                continue
+            try:
+                self.rpc.eth_sendRawTransaction('0x' + hexlify(signed.raw).decode('ascii'))
+            except EthJsonRpcError as ex:
+                if not _is_nonce_too_low(ex):
+                    raise
+                # Was mined since the transaction count was retrieved
+                with self._lock:
+                    self._pending.pop(signed.nonce, None)
+        return len(self._pending)
+
+    def _wait_slot(self):
+        """Wait until fewer than `max_pending` transactions are unconfirmed"""
+        while self.refresh() >= self.max_pending:
+            oldest = self.pending[0]
+            EthTransaction(self.rpc, oldest.txid).wait()
+
+    def wait_all(self):
+        """Wait for all pending transactions to be mined, returns their receipts"""
+        receipts = [EthTransaction(self.rpc, _.txid).wait() for _ in self.pending]
+        self.refresh()
+        return receipts
@@ -4,6 +4,7 @@
 
 import sys
 import json
+import struct
 from base64 import b64encode, b64decode
 from binascii import hexlify, unhexlify
 from functools import reduce
@@ -19,7 +20,9 @@ safe_ord = ord if sys.version_info.major == 2 else lambda x: x if isinstance(x,
 
 
 def bytes_to_int(x):
-    return reduce(lambda o, b: (o << 8) + safe_ord(b), [0] + list(x))
+    if isinstance(x, str):
+        return reduce(lambda o, b: (o << 8) + safe_ord(b), [0] + list(x))
+    return int.from_bytes(x, 'big')
 
 
 def bit_clear(n, b):
@@ -56,18 +59,48 @@ def zpad(x, l):
 
 
 def u256be(v):
-    # TODO: verify range
-    return zpad(int_to_big_endian(v), 32)
+    return v.to_bytes(32, 'big')
 
 
 def u64be(v):
-    # TODO: verify range
-    return zpad(int_to_big_endian(v), 8)
+    return v.to_bytes(8, 'big')
 
 
 def u32be(v):
-    # TODO: verify range
-    return zpad(int_to_big_endian(v), 4)
+    return v.to_bytes(4, 'big')
+
+
+def pack_u256_array(values):
+    """Packs a list of integers into consecutive 32 byte big-endian values"""
+    return b''.join([_.to_bytes(32, 'big') for _ in values])
+
+
+def unpack_u256_array(data):
+    """
+    Unpacks consecutive 32 byte big-endian values into a list of integers,
+    the data is read through a memoryview rather than being sliced.
+    """
+    data = memoryview(data)
+    require(len(data) % 32 == 0, "Data length must be a multiple of 32")
+    return [int.from_bytes(data[i:i + 32], 'big') for i in range(0, len(data), 32)]
+
+
+def pack_u64_array(values):
+    return struct.pack('>%dQ' % (len(values),), *values)
+
+
+def unpack_u64_array(data):
+    require(len(data) % 8 == 0, "Data length must be a multiple of 8")
+    return list(struct.unpack('>%dQ' % (len(data) // 8,), data))
+
+
+def pack_u32_array(values):
+    return struct.pack('>%dL' % (len(values),), *values)
+
+
+def unpack_u32_array(data):
+    require(len(data) % 4 == 0, "Data length must be a multiple of 4")
+    return list(struct.unpack('>%dL' % (len(data) // 4,), data))
 
 
 def flatten(l):
@@ -0,0 +1,147 @@
+# Copyright (c) 2018 HarryR. All Rights Reserved.
+# SPDX-License-Identifier: LGPL-3.0+
+
+"""
+Waits for the receipts of many transactions together
+
+Rather than polling for the receipt of each transaction, all pending
+transactions are checked with a single batch request once per new block:
+
+    rpc.watcher = ReceiptWatcher(rpc)
+    receipts = rpc.watcher.wait_all([tx_a, tx_b], timeout=60)
+
+Once `rpc.watcher` is set, `EthTransaction.receipt(wait=True)` uses it too.
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import Future, wait, TimeoutError
+
+from .ethrpc import EthJsonRpcError
+
+
+DEFAULT_INTERVAL = 0.5
+
+log = logging.getLogger(__name__)
+
+
+def _txid(tx):
+    txid = str(tx)
+    if txid[:2] != '0x':
+        txid = '0x' + txid
+    return txid
+
+
+class ReceiptWatcher(object):
+    """
+    Tracks pending transactions, resolving a `Future` for each as its receipt
+    appears. A background thread polls for new blocks every `interval`
+    seconds, and runs only while there are pending transactions.
+    """
+    def __init__(self, rpc, interval=DEFAULT_INTERVAL):
+        self.rpc = rpc
+        self.interval = interval
+        self._pending = dict()
+        self._unchecked = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+        self._block_number = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def watch(self, tx, callback=None):
+        """
+        Returns a `Future` for the receipt of a transaction, `callback` is
+        called with the receipt once it has been found.
+        """
+        txid = _txid(tx)
+        with self._lock:
+            future = self._pending.get(txid)
+            if future is None:
+                future = Future()
+                self._pending[txid] = future
+                self._unchecked.add(txid)
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        if callback is not None:
+            future.add_done_callback(lambda _: _.cancelled() or callback(_.result()))
+        return future
+
+    def wait_all(self, txs, timeout=None):
+        """
+        Returns the receipts of all transactions, in the same order, raises
+        `TimeoutError` if they aren't all found within `timeout` seconds.
+        """
+        futures = [self.watch(_) for _ in txs]
+        _, not_done = wait(futures, timeout)
+        if not_done:
+            raise TimeoutError("%d of %d transactions have no receipt" % (len(not_done), len(futures)))
+        return [_.result() for _ in futures]
+
+    def stop(self):
+        """Stops the background thread, pending futures are cancelled"""
+        with self._lock:
+            self._stopped = True
+            thread = self._thread
+            pending, self._pending = self._pending, dict()
+            self._unchecked.clear()
+        for future in pending.values():
+            future.cancel()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _run(self):
+        try:
+            while True:
+                with self._lock:
+                    if self._stopped or not self._pending:
+                        self._thread = None
+                        return
+                try:
+                    self.tick()
+                except EthJsonRpcError:
+                    # Retried upon the next tick
+                    pass
+                except Exception:
+                    log.exception("Failed to check receipts, retrying")
+                time.sleep(self.interval)
+        finally:
+            # Allows another thread to be started if this one dies
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+
+    def tick(self):
+        """
+        Checks for the receipts of newly added transactions, and of all
+        pending transactions if there has been a new block.
+        """
+        block_number = self.rpc.eth_blockNumber()
+        with self._lock:
+            if block_number != self._block_number:
+                self._block_number = block_number
+                txids = list(self._pending.keys())
+            else:
+                txids = list(self._unchecked)
+            self._unchecked.clear()
+        if not txids:
+            return
+
+        calls = [('eth_getTransactionReceipt', [_]) for _ in txids]
+        for txid, result in zip(txids, self.rpc._call_batch(calls)):
+            with self._lock:
+                if result.exception() is not None:
+                    # Checked again upon the next tick
+                    if txid in self._pending:
+                        self._unchecked.add(txid)
+                    continue
+                if not result.result():
+                    continue
+                future = self._pending.pop(txid, None)
+            if future is not None:
+                future.set_result(result.result())
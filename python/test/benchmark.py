@@ -0,0 +1,122 @@
+# Copyright (c) 2018 HarryR. All Rights Reserved.
+# SPDX-License-Identifier: LGPL-3.0+
+
+"""
+Benchmarks for the merkle tree, leaf packing and proof generation hot paths
+
+Synthetic blocks of 1 to 100k leaves are served by `FakeRPC`, results are
+written as JSON so runs can be compared, e.g.
+
+    PYTHONPATH=. python test/benchmark.py --output before.json
+    PYTHONPATH=. python test/benchmark.py --baseline before.json
+"""
+
+import sys
+import json
+import time
+import platform
+
+import click
+
+from panautomata.utils import u256be
+from panautomata.merkle import merkle_tree, merkle_path, merkle_proof
+from panautomata.lithium.common import pack_txn, pack_log, verify_proof, process_block, proof_for_tx, proof_prefix
+
+from fakerpc import synthetic_block
+
+
+DEFAULT_SIZES = (1, 10, 100, 1000, 10000, 100000)
+
+SAMPLE_SIZE = 1000
+
+
+def measure(name, size, func, args_list, repeat):
+    """
+    Time `func` called with every set of args in `args_list`, `repeat` times
+    """
+    timings = []
+    for _ in range(0, repeat):
+        begin = time.perf_counter()
+        for args in args_list:
+            func(*args)
+        timings.append(time.perf_counter() - begin)
+    ops = len(args_list)
+    return dict(name=name, size=size, ops=ops, repeat=repeat,
+                min=min(timings), max=max(timings), mean=sum(timings) / repeat,
+                per_op=min(timings) / ops)
+
+
+def run_benchmarks(size, repeat):
+    height = 10
+    rpc, transactions, receipts = synthetic_block(height, size)
+    logs = [log for receipt in receipts for log in receipt['logs']]
+
+    items = [pack_txn(_) for _ in transactions] + [pack_log(_) for _ in logs]
+    tree, root = merkle_tree(items)
+    sample = items[:SAMPLE_SIZE]
+    paths = [merkle_path(_, tree) for _ in sample]
+    # Prefix isn't used when verifying
+    prefix = proof_prefix(transactions[0])
+    proofs = [prefix + b''.join([u256be(_) for _ in path]) for path in paths]
+    sample_txs = transactions[:SAMPLE_SIZE]
+
+    yield measure('pack_txn', size, pack_txn, [(_,) for _ in sample_txs], repeat)
+    if logs:
+        yield measure('pack_log', size, pack_log, [(_,) for _ in logs[:SAMPLE_SIZE]], repeat)
+    yield measure('merkle_tree', size, merkle_tree, [(items,)], repeat)
+    yield measure('merkle_path', size, merkle_path, [(_, tree) for _ in sample], repeat)
+    yield measure('merkle_proof', size, merkle_proof, [(item, path, root) for item, path in zip(sample, paths)], repeat)
+    yield measure('verify_proof', size, verify_proof, [(root, item, proof) for item, proof in zip(sample, proofs)], repeat)
+    yield measure('process_block', size, process_block, [(rpc, height)], repeat)
+    yield measure('proof_for_tx', size, proof_for_tx, [(rpc, transactions[-1]['hash'])], repeat)
+
+
+def compare(baseline, results, threshold):
+    """
+    Returns the list of results which are slower than the baseline by more
+    than `threshold`, as a fraction, per operation.
+    """
+    previous = {(_['name'], _['size']): _ for _ in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get((result['name'], result['size']))
+        if before is None:
+            continue
+        ratio = result['per_op'] / before['per_op']
+        if ratio > (1 + threshold):
+            regressions.append(dict(result, baseline=before['per_op'], ratio=ratio))
+    return regressions
+
+
+@click.command(help="Benchmark merkle, packing and proof generation")
+@click.option('--size', 'sizes', type=int, multiple=True, metavar="N", help="Number of leaves in each block, may be repeated")
+@click.option('--repeat', type=int, default=3, metavar="N", help="Run each benchmark N times")
+@click.option('--output', type=click.File('w'), default='-', metavar="file", help="Write JSON results to file")
+@click.option('--baseline', type=click.File('r'), metavar="file", help="Compare against previous JSON results")
+@click.option('--threshold', type=float, default=0.2, metavar="F", help="Fraction slower than baseline considered a regression")
+def main(sizes, repeat, output, baseline, threshold):
+    results = []
+    for size in (sizes or DEFAULT_SIZES):
+        for result in run_benchmarks(size, repeat):
+            print("%-14s %7d leaves %6d ops %12.3f us/op" % (result['name'], result['size'], result['ops'], result['per_op'] * 1000000), file=sys.stderr)
+            results.append(result)
+
+    report = dict(
+        python=platform.python_version(),
+        platform=platform.platform(),
+        timestamp=int(time.time()),
+        results=results)
+    json.dump(report, output, indent=2, sort_keys=True)
+    output.write('\n')
+
+    if baseline:
+        regressions = compare(json.load(baseline), results, threshold)
+        for result in regressions:
+            print("REGRESSION %-14s %7d leaves %.2fx slower" % (result['name'], result['size'], result['ratio']), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(standalone_mode=False))
@@ -0,0 +1,97 @@
+from binascii import hexlify, unhexlify
+
+import rlp
+
+from panautomata.crypto import keccak_256, EcdsaSignature
+from panautomata.utils import big_endian_to_int, int_to_big_endian, zpad
+
+
+class FakeDevChain(object):
+    """
+    Accepts signed transactions, which are mined when `mine` is called
+
+    Only the nonces and signatures of transactions are checked, they aren't
+    executed.
+    """
+    def __init__(self):
+        self.height = 0
+        self.min_gas_price = 1
+        self.nonces = dict()
+        self.pool = dict()
+        self.transactions = dict()
+        self.receipts = dict()
+
+    def _sender(self, fields):
+        v, r, s = [big_endian_to_int(_) for _ in fields[6:]]
+        if v >= 35:
+            chain_id = (v - 35) // 2
+            v -= 8 + (chain_id * 2)
+            sighash = keccak_256(rlp.encode(fields[:6] + [chain_id, 0, 0])).digest()
+        else:
+            sighash = keccak_256(rlp.encode(fields[:6])).digest()
+        signature = EcdsaSignature(v, zpad(int_to_big_endian(r), 32), zpad(int_to_big_endian(s), 32))
+        return hexlify(signature.recover(sighash)).decode('ascii')
+
+    def eth_sendRawTransaction(self, raw):
+        raw = unhexlify(raw[2:])
+        fields = rlp.decode(raw)
+        sender = self._sender(fields)
+        nonce = big_endian_to_int(fields[0])
+        gas_price = big_endian_to_int(fields[1])
+        if nonce < self.nonces.get(sender, 0):
+            raise ValueError('nonce too low')
+        if gas_price < self.min_gas_price:
+            raise ValueError('transaction underpriced')
+        txid = '0x' + keccak_256(raw).hexdigest()
+        for other in list(self.pool.values()):
+            if other['from'] == sender and other['nonce'] == nonce:
+                if gas_price < other['gasPrice'] * 1.1:
+                    raise ValueError('replacement transaction underpriced')
+                del self.pool[other['hash']]
+        self.pool[txid] = {'hash': txid, 'from': sender, 'nonce': nonce, 'gasPrice': gas_price,
+                           'to': hexlify(fields[3]).decode('ascii'), 'input': hexlify(fields[5]).decode('ascii'),
+                           'blockNumber': None}
+        return txid
+
+    def _pending_nonce(self, sender):
+        nonce = self.nonces.get(sender, 0)
+        nonces = set([_['nonce'] for _ in self.pool.values() if _['from'] == sender])
+        while nonce in nonces:
+            nonce += 1
+        return nonce
+
+    def eth_getTransactionCount(self, address, block):
+        address = address[2:] if address[:2] == '0x' else address
+        if block == 'pending':
+            return hex(self._pending_nonce(address))
+        return hex(self.nonces.get(address, 0))
+
+    def eth_getTransactionByHash(self, txid):
+        if txid in self.pool:
+            return self.pool[txid]
+        return self.transactions[txid]
+
+    def eth_getTransactionReceipt(self, txid):
+        return self.receipts[txid]
+
+    def eth_blockNumber(self):
+        return hex(self.height)
+
+    def drop(self, txid):
+        del self.pool[txid]
+
+    def mine(self):
+        """Mine all pending transactions which have the next nonce of their sender"""
+        self.height += 1
+        included = True
+        while included:
+            included = False
+            for txn in sorted(self.pool.values(), key=lambda _: _['nonce']):
+                if txn['nonce'] != self.nonces.get(txn['from'], 0):
+                    continue
+                del self.pool[txn['hash']]
+                self.nonces[txn['from']] = txn['nonce'] + 1
+                self.transactions[txn['hash']] = dict(txn, blockNumber=hex(self.height))
+                self.receipts[txn['hash']] = {'transactionHash': txn['hash'], 'blockNumber': hex(self.height),
+                                              'blockHash': '0x%064x' % (self.height,), 'status': '0x1'}
+                included = True
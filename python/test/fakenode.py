@@ -0,0 +1,61 @@
+import json
+import threading
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeNodeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        self.server.node.requests.append(request)
+        if isinstance(request, list):
+            # Reversed, as the order of batch responses isn't guaranteed
+            response = [self.server.node.dispatch(_) for _ in reversed(request)]
+        else:
+            response = self.server.node.dispatch(request)
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeNode(object):
+    """
+    Serves JSON-RPC requests over HTTP on localhost, calling the methods of `backend`
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self.requests = []
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), FakeNodeHandler)
+        self._server.node = self
+        self.host, self.port = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def dispatch(self, request):
+        method = getattr(self.backend, request['method'], None)
+        if method is None:
+            return {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': -32601, 'message': 'Method not found'}}
+        try:
+            result = method(*request['params'])
+        except KeyError:
+            result = None
+        except ValueError as ex:
+            return {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': -32000, 'message': str(ex)}}
+        return {'jsonrpc': '2.0', 'id': request['id'], 'result': result}
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -1,10 +1,26 @@
+import time
+
+from panautomata.crypto import keccak_256
+from panautomata.ethrpc import BadResponseError
+
+
+# Logs of each transaction in a synthetic block
+LOGS_PER_TX = 3
+
 
 class FakeRPC(object):
-    def __init__(self, in_blocks, in_transactions, in_receipts):
+    def __init__(self, in_blocks, in_transactions, in_receipts, max_logs=None):
         self._blocks_by_height = {int(_['number'], 16): _ for _ in in_blocks}
-        #self._blocks_by_hash = {_['hash']: _ for _ in in_blocks}
+        self._blocks_by_hash = {_['hash']: _ for _ in in_blocks}
         self._transactions = {_['hash']: _ for _ in in_transactions}
         self._receipts = {_['transactionHash']: _ for _ in in_receipts}
+        # Limit of logs returned by eth_getLogs, as imposed by some nodes
+        self._max_logs = max_logs
+
+    def _block(self, block, tx_objects):
+        if not tx_objects:
+            return block
+        return dict(block, transactions=[self._transactions[_] for _ in block['transactions']])
 
     def eth_getTransactionByHash(self, tx_hash):
         return self._transactions[tx_hash]
@@ -12,6 +28,114 @@ class FakeRPC(object):
     def eth_getTransactionReceipt(self, tx_hash):
         return self._receipts[tx_hash]
 
+    def eth_getBlockByHash(self, block_hash, tx_objects=True):
+        return self._block(self._blocks_by_hash[block_hash], tx_objects)
+
     def eth_getBlockByNumber(self, block_height, tx_objects=True):
-        assert tx_objects is False  # is only used this way
-        return self._blocks_by_height[block_height]
+        if isinstance(block_height, str):
+            block_height = int(block_height, 16)
+        return self._block(self._blocks_by_height[block_height], tx_objects)
+
+    def eth_getLogs(self, filter_object):
+        from_height = int(filter_object['fromBlock'], 16)
+        to_height = int(filter_object['toBlock'], 16)
+        logs = [log
+                for height in range(from_height, to_height + 1) if height in self._blocks_by_height
+                for tx_hash in self._blocks_by_height[height]['transactions']
+                for log in self._receipts[tx_hash]['logs']]
+        if self._max_logs is not None and len(logs) > self._max_logs:
+            raise BadResponseError({'code': -32005, 'message': 'query returned more than %d results' % (self._max_logs,)})
+        return logs
+
+
+def hex_hash(*args):
+    return '0x' + keccak_256(b''.join([str(_).encode('ascii') for _ in args])).hexdigest()
+
+
+def synthetic_block(height, leaf_count):
+    """
+    Creates a block with transactions and logs which pack into `leaf_count` leaves
+    """
+    block_hash = hex_hash('block', height)
+    transactions = []
+    receipts = []
+    leaves = 0
+    while leaves < leaf_count:
+        tx_index = len(transactions)
+        tx_hash = hex_hash('tx', height, tx_index)
+        remaining = leaf_count - leaves - 1
+        transactions.append({
+            'hash': tx_hash,
+            'blockHash': block_hash,
+            'blockNumber': hex(height),
+            'transactionIndex': hex(tx_index),
+            'from': '0x' + hex_hash('from', tx_index)[-40:],
+            'to': '0x' + hex_hash('to', tx_index)[-40:],
+            'value': hex(tx_index),
+            'input': hex_hash('input', tx_index),
+        })
+        receipts.append({
+            'transactionHash': tx_hash,
+            'transactionIndex': hex(tx_index),
+            'blockHash': block_hash,
+            'blockNumber': hex(height),
+            'status': '0x1',
+            'logs': [{
+                'address': '0x' + hex_hash('address', tx_index)[-40:],
+                'topics': [hex_hash('topic', tx_index, log_idx)],
+                'data': hex_hash('data', tx_index, log_idx),
+                'blockHash': block_hash,
+                'blockNumber': hex(height),
+                'transactionHash': tx_hash,
+                'transactionIndex': hex(tx_index),
+                'logIndex': hex(log_idx),
+            } for log_idx in range(0, min(LOGS_PER_TX, remaining))]
+        })
+        leaves += 1 + len(receipts[-1]['logs'])
+    block = {
+        'number': hex(height),
+        'hash': block_hash,
+        'transactions': [_['hash'] for _ in transactions],
+    }
+    return FakeRPC([block], transactions, receipts), transactions, receipts
+
+
+def synthetic_chain(heights, leaf_count, max_logs=None):
+    """FakeRPC with many blocks, the first transaction of each block creates a contract"""
+    blocks, transactions, receipts = [], [], []
+    for height in heights:
+        rpc, block_transactions, block_receipts = synthetic_block(height, leaf_count)
+        block_transactions[0]['to'] = None
+        blocks.append(rpc.eth_getBlockByNumber(height, False))
+        transactions += block_transactions
+        receipts += block_receipts
+    return FakeRPC(blocks, transactions, receipts, max_logs=max_logs)
+
+
+def block_tx_hash(rpc, height, index=1):
+    return rpc.eth_getBlockByNumber(height, False)['transactions'][index]
+
+
+class CountingRPC(object):
+    """Records the methods called"""
+    def __init__(self, rpc):
+        self.rpc = rpc
+        self.calls = []
+
+    def __getattr__(self, name):
+        self.calls.append(name)
+        return getattr(self.rpc, name)
+
+
+class SlowRPC(object):
+    """Takes a while to retrieve blocks"""
+    def __init__(self, rpc, delay=0.2):
+        self.rpc = rpc
+        self.delay = delay
+
+    def eth_getBlockByNumber(self, *args):
+        time.sleep(self.delay)
+        return self.rpc.eth_getBlockByNumber(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.rpc, name)
@@ -0,0 +1,90 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from binascii import hexlify, unhexlify
+
+from eth_abi import encode_abi
+
+from panautomata.abi import AbiRegistry, function_selector
+from panautomata.ethrpc import EthJsonRpc
+
+from fakenode import FakeNode
+
+
+TOKEN_ABI = [
+    {'type': 'function', 'name': 'balanceOf', 'constant': True,
+     'inputs': [{'name': 'owner', 'type': 'address'}],
+     'outputs': [{'name': '', 'type': 'uint256'}]},
+    {'type': 'function', 'name': 'info', 'constant': True, 'inputs': [],
+     'outputs': [{'name': '', 'type': 'uint8'}, {'name': '', 'type': 'bytes32'}]},
+    {'type': 'function', 'name': 'transfer', 'constant': False,
+     'inputs': [{'name': 'to', 'type': 'address'}, {'name': 'value', 'type': 'uint256'}],
+     'outputs': [{'name': '', 'type': 'bool'}]},
+    {'type': 'event', 'name': 'Transfer', 'anonymous': False, 'inputs': []},
+]
+
+OWNER = '0x' + ('11' * 20)
+
+
+class FakeToken(object):
+    def __init__(self):
+        self.calls = []
+
+    def eth_call(self, obj, block):
+        self.calls.append(obj)
+        data = obj['data'][2:] if obj['data'][:2] == '0x' else obj['data']
+        selector = unhexlify(data[:8])
+        if selector == function_selector('balanceOf(address)'):
+            return '0x' + hexlify(encode_abi(['uint256'], [1234])).decode('ascii')
+        return '0x' + hexlify(encode_abi(['uint8', 'bytes32'], [7, b'x' * 32])).decode('ascii')
+
+
+class TestAbiRegistry(unittest.TestCase):
+    def test_function(self):
+        abi = AbiRegistry().load(TOKEN_ABI)
+        transfer = abi.function('transfer')
+        self.assertEqual(transfer.signature, 'transfer(address,uint256)')
+        self.assertEqual(hexlify(transfer.selector), b'a9059cbb')
+        self.assertIs(abi.function(transfer.alias), transfer)
+        self.assertEqual(transfer.encode([OWNER, 10]), transfer.selector + encode_abi(['address', 'uint256'], [OWNER, 10]))
+        self.assertEqual(transfer.decode_result(encode_abi(['bool'], [True])), True)
+        self.assertEqual(abi.function('info').decode_result(encode_abi(['uint8', 'bytes32'], [7, b'x' * 32])), (7, b'x' * 32))
+        self.assertEqual(len(abi.functions), 3)
+
+    def test_cached(self):
+        registry = AbiRegistry()
+        abi = registry.load(TOKEN_ABI)
+        self.assertIs(registry.load(list(TOKEN_ABI)), abi)
+        self.assertIs(registry.load({'abi': TOKEN_ABI, 'bytecode': '0x'}), abi)
+        self.assertIs(registry.load(io.StringIO(json.dumps(TOKEN_ABI))), abi)
+
+        tempdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempdir, 'Token.json')
+            with open(path, 'w') as handle:
+                json.dump({'abi': TOKEN_ABI}, handle)
+            from_file = registry.load(path)
+            self.assertIs(registry.load(path), from_file)
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_proxy(self):
+        backend = FakeToken()
+        node = FakeNode(backend)
+        try:
+            rpc = EthJsonRpc(node.host, node.port)
+            token = rpc.proxy(TOKEN_ABI, OWNER)
+            self.assertFalse(hasattr(token, 'transfer'))
+            self.assertEqual(token.balanceOf(OWNER), 1234)
+            self.assertEqual(token.info(), (7, b'x' * 32))
+            self.assertEqual(backend.calls[0]['to'], OWNER[2:])
+
+            # Proxies of the same ABI share the same type
+            with_account = rpc.proxy(TOKEN_ABI, OWNER, OWNER)
+            self.assertTrue(hasattr(with_account, 'transfer'))
+            self.assertIs(type(with_account), type(rpc.proxy(TOKEN_ABI, OWNER, OWNER)))
+        finally:
+            node.stop()
@@ -0,0 +1,95 @@
+import asyncio
+import unittest
+
+from panautomata.ethrpc import EthJsonRpc, BadResponseError
+from panautomata.aioethrpc import AsyncEthJsonRpc
+
+from fakenode import FakeNode
+from test_lithium_common import FAKERPC_INSTANCE
+
+
+TX_HASH = '0x87f2dd1a154c8f11a153bdcd90fc67ab850e9f32f05a5becc79d3fe035b1c4fd'
+
+
+class TestEthJsonRpc(unittest.TestCase):
+    def setUp(self):
+        self.node = FakeNode(FAKERPC_INSTANCE)
+        self.rpc = EthJsonRpc(self.node.host, self.node.port)
+
+    def tearDown(self):
+        self.node.stop()
+
+    def test_call(self):
+        self.assertEqual(self.rpc.eth_getTransactionByHash(TX_HASH)['hash'], TX_HASH)
+        self.assertEqual(self.rpc.eth_getTransactionReceipt(TX_HASH)['transactionHash'], TX_HASH)
+        with self.assertRaises(BadResponseError):
+            self.rpc.eth_blockNumber()
+        # Every call has a unique id
+        self.assertEqual(len(set([_['id'] for _ in self.node.requests])), 3)
+
+    def test_batch(self):
+        results = self.rpc.batch([('eth_getTransactionByHash', [TX_HASH]),
+                                  ('eth_getTransactionReceipt', [TX_HASH]),
+                                  ('eth_getBlockByNumber', ['0xa', False])])
+        self.assertEqual(len(self.node.requests), 1)
+        self.assertEqual(results[0]['hash'], TX_HASH)
+        self.assertEqual(results[1]['transactionHash'], TX_HASH)
+        self.assertEqual(results[2]['transactions'], [TX_HASH])
+        self.assertEqual(self.rpc.batch([]), [])
+
+        with self.assertRaises(BadResponseError):
+            self.rpc.batch([('eth_getTransactionByHash', [TX_HASH]), ('eth_blockNumber', [])])
+
+    def test_batch_context(self):
+        with self.rpc.batch() as batch:
+            transaction = batch.call('eth_getTransactionByHash', [TX_HASH])
+            missing = batch.call('eth_blockNumber')
+            receipt = batch.call('eth_getTransactionReceipt', [TX_HASH])
+        self.assertEqual(len(self.node.requests), 1)
+        self.assertEqual(transaction.result()['hash'], TX_HASH)
+        self.assertEqual(receipt.result()['transactionHash'], TX_HASH)
+        with self.assertRaises(BadResponseError):
+            missing.result()
+
+
+class TestAsyncEthJsonRpc(unittest.TestCase):
+    def setUp(self):
+        self.node = FakeNode(FAKERPC_INSTANCE)
+        self.rpc = AsyncEthJsonRpc(self.node.host, self.node.port, max_connections=2)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.rpc.close())
+        self.loop.close()
+        self.node.stop()
+
+    def test_gather(self):
+        async def run():
+            return await asyncio.gather(*[self.rpc.eth_getTransactionReceipt(TX_HASH) for _ in range(0, 20)])
+        receipts = self.loop.run_until_complete(run())
+        self.assertEqual([_['transactionHash'] for _ in receipts], [TX_HASH] * 20)
+        self.assertEqual(len(set([_['id'] for _ in self.node.requests])), 20)
+        # Connections are re-used, never more than the limit are opened
+        self.assertLessEqual(len(self.rpc._idle), 2)
+
+    def test_error(self):
+        with self.assertRaises(BadResponseError):
+            self.loop.run_until_complete(self.rpc.eth_blockNumber())
+
+    def test_batch(self):
+        results = self.loop.run_until_complete(self.rpc.batch([
+            ('eth_getTransactionByHash', [TX_HASH]),
+            ('eth_getBlockByNumber', ['0xa', False])]))
+        self.assertEqual(len(self.node.requests), 1)
+        self.assertEqual(results[0]['hash'], TX_HASH)
+        self.assertEqual(results[1]['transactions'], [TX_HASH])
+
+        async def run():
+            async with self.rpc.batch() as batch:
+                transaction = batch.call('eth_getTransactionByHash', [TX_HASH])
+                missing = batch.call('eth_blockNumber')
+            return transaction, missing
+        transaction, missing = self.loop.run_until_complete(run())
+        self.assertEqual(transaction.result()['hash'], TX_HASH)
+        with self.assertRaises(BadResponseError):
+            missing.result()
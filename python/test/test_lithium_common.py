@@ -1,12 +1,16 @@
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
 from binascii import unhexlify, hexlify
 
 from panautomata.utils import bytes_to_int
 from panautomata.merkle import merkle_tree
-from panautomata.lithium.common import verify_proof, process_block, proof_for_tx, process_transaction
+from panautomata.ethrpc import EthJsonRpc, EthJsonRpcError
+from panautomata.lithium.common import verify_proof, process_block, proof_for_tx, process_transaction, multiproof_for, verify_multiproof, process_block_range, process_block_range_tree, process_blocks, ProofEngine, pack_log, tx_key
 
-from fakerpc import FakeRPC
+from fakerpc import FakeRPC, synthetic_chain, block_tx_hash, CountingRPC, SlowRPC
+from fakenode import FakeNode
 
 
 FAKERPC_INSTANCE = FakeRPC(
@@ -82,3 +86,144 @@ class TestLithiumCommon(unittest.TestCase):
         self.assertEqual(proof, unhexlify('000000000000000a0000000000000000e6843bf393570479a2656a819bf8d219c1dde89fe0b6f73c6299bf202fe755d1'))
 
         self.assertEqual(verify_proof(block.root, leaf, proof), True)
+
+    def test_multiproof_tx(self):
+        block, block_tx_count, block_log_count = process_block(FAKERPC_INSTANCE, 10)
+
+        tx_hash = '0x87f2dd1a154c8f11a153bdcd90fc67ab850e9f32f05a5becc79d3fe035b1c4fd'
+        leaf = process_transaction(FAKERPC_INSTANCE, tx_hash)
+
+        proof = multiproof_for(FAKERPC_INSTANCE, [(tx_hash, None)])
+        self.assertEqual(len(proof), 8 + 4 + 12 + 32)
+        # Path for a single leaf is the same as its normal proof
+        self.assertEqual(proof[-32:], proof_for_tx(FAKERPC_INSTANCE, tx_hash)[16:])
+
+        self.assertEqual(verify_multiproof(block.root, [leaf], proof), True)
+        self.assertEqual(verify_multiproof(block.root + 1, [leaf], proof), False)
+
+    def test_block_range(self):
+        rpc = synthetic_chain(range(10, 15), 50, max_logs=60)
+        results = process_block_range(rpc, 10, 14)
+        self.assertEqual([_[0].height for _ in results], list(range(10, 15)))
+        for height, result in zip(range(10, 15), results):
+            self.assertEqual(result, process_block(rpc, height))
+        # Logs of the contract creation transaction are excluded
+        self.assertEqual(results[0][1:], (12, 34))
+        for block, tree, _, _ in process_block_range_tree(rpc, 10, 14):
+            self.assertEqual(tree.root, block.root)
+
+        # Too many logs in a single block
+        rpc = synthetic_chain([10], 50, max_logs=10)
+        with self.assertRaises(EthJsonRpcError):
+            process_block_range(rpc, 10, 10)
+
+    def test_block_tx_objects(self):
+        rpc = CountingRPC(synthetic_chain([10], 20))
+        block, tx_count, log_count = process_block(rpc, 10)
+        # Transactions are part of the block, only receipts are retrieved
+        self.assertEqual(rpc.calls, ['eth_getBlockByNumber'] + (['eth_getTransactionReceipt'] * tx_count))
+
+        transaction = rpc.eth_getTransactionByHash(block_tx_hash(rpc, 10))
+        self.assertEqual(process_transaction(rpc, transaction), process_transaction(rpc, transaction['hash']))
+
+    def test_blocks_concurrent(self):
+        fake = synthetic_chain(range(10, 20), 30)
+        expected = [process_block(fake, _) for _ in range(10, 20)]
+        node = FakeNode(fake)
+        try:
+            rpc = EthJsonRpc(node.host, node.port)
+            with ThreadPoolExecutor(4) as executor:
+                self.assertEqual(process_blocks(rpc, list(range(10, 20)), executor), expected)
+                self.assertEqual(process_block_range(rpc, 10, 19, executor=executor), expected)
+        finally:
+            node.stop()
+
+    def test_proof_engine(self):
+        fake = synthetic_chain([10, 11], 30)
+        rpc = CountingRPC(fake)
+        engine = ProofEngine(rpc, cache_size=1)
+        block, _, _ = process_block(fake, 10)
+        tx_hashes = fake.eth_getBlockByNumber(10, False)['transactions']
+
+        for tx_hash in tx_hashes[1:]:
+            leaf = process_transaction(fake, tx_hash)
+            self.assertTrue(verify_proof(block.root, leaf, engine.prove_tx(tx_hash)))
+            for log_idx, log in enumerate(fake.eth_getTransactionReceipt(tx_hash)['logs']):
+                self.assertTrue(verify_proof(block.root, pack_log(log), engine.prove_event(tx_hash, log_idx)))
+        refs = [(_, None) for _ in tx_hashes[1:]]
+        self.assertEqual(engine.prove_many(refs), [proof_for_tx(fake, tx_hash) for tx_hash, _ in refs])
+        self.assertEqual(engine.multiproof(refs), multiproof_for(fake, refs))
+        # The block was retrieved once, for the first proof
+        self.assertEqual(rpc.calls.count('eth_getBlockByNumber'), 1)
+        self.assertEqual(rpc.calls.count('eth_getTransactionByHash'), 1)
+
+        # Contract creation has no leaf
+        with self.assertRaises(RuntimeError):
+            engine.prove_tx(tx_hashes[0])
+        with self.assertRaises(RuntimeError):
+            engine.prove_event(tx_hashes[1], 100)
+
+        # Least recently used block is forgotten
+        engine.prove_tx(block_tx_hash(fake, 11))
+        self.assertEqual(len(engine), 1)
+        engine.prove_tx(tx_hashes[1])
+        self.assertEqual(rpc.calls.count('eth_getBlockByNumber'), 3)
+
+    def test_proof_engine_errors(self):
+        fake = synthetic_chain([10], 10)
+        engine = ProofEngine(fake)
+        tx_hashes = fake.eth_getBlockByNumber(10, False)['transactions']
+        refs = [(_, None) for _ in tx_hashes]
+        engine.prove_many(refs[1:])
+
+        # Each proof which can't be made is an error, the others are still made
+        key = (tx_key(tx_hashes[1]), None)
+        engine._refs[key] = engine._refs[key]._replace(leaf=b'\0' * 72)
+        results = dict(engine.iter_proofs(refs))
+        self.assertEqual(sorted(results.keys()), list(range(0, len(refs))))
+        self.assertIsInstance(results[0], RuntimeError)
+        self.assertIsInstance(results[1], RuntimeError)
+        self.assertEqual(results[2], proof_for_tx(fake, tx_hashes[2]))
+
+    def test_proof_engine_concurrent(self):
+        fake = synthetic_chain([10], 30)
+        rpc = CountingRPC(SlowRPC(fake))
+        engine = ProofEngine(rpc)
+        tx_hashes = fake.eth_getBlockByNumber(10, False)['transactions'][1:]
+        with ThreadPoolExecutor(len(tx_hashes)) as executor:
+            proofs = list(executor.map(engine.prove_tx, tx_hashes))
+        self.assertEqual(proofs, [proof_for_tx(fake, _) for _ in tx_hashes])
+        # Requests waited for the block to be retrieved once
+        self.assertEqual(rpc.calls.count('eth_getBlockByNumber'), 1)
+
+    def test_proof_engine_reorg(self):
+        fake = synthetic_chain([10], 10)
+        engine = ProofEngine(SlowRPC(fake))
+        tx_hash = block_tx_hash(fake, 10)
+        block_hash = process_block(fake, 10)[0].hash
+
+        # Loading the block for a transaction with another block hash
+        with ThreadPoolExecutor(2) as executor:
+            owner = executor.submit(engine._load_block, 10, block_hash + 1)
+            time.sleep(0.05)
+            waiter = executor.submit(engine._load_block, 10, block_hash + 1)
+            with self.assertRaises(RuntimeError):
+                owner.result()
+            with self.assertRaises(RuntimeError):
+                waiter.result()
+        self.assertEqual(engine.prove_tx(tx_hash), proof_for_tx(fake, tx_hash))
+
+        # Transaction which was mined in a block that's since been replaced
+        fake.eth_getTransactionByHash(tx_hash)['blockHash'] = '0x' + ('00' * 32)
+        with self.assertRaises(RuntimeError):
+            ProofEngine(fake).prove_tx(tx_hash)
+
+    def test_proof_engine_ttl(self):
+        fake = synthetic_chain([10], 10)
+        tx_hash = block_tx_hash(fake, 10)
+        for ttl, block_count in [(None, 1), (0, 3)]:
+            rpc = CountingRPC(fake)
+            engine = ProofEngine(rpc, ttl=ttl)
+            for _ in range(0, 3):
+                engine.prove_tx(tx_hash)
+            self.assertEqual(rpc.calls.count('eth_getBlockByNumber'), block_count)
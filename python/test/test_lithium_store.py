@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from panautomata.lithium.common import process_block, proof_for_tx, proof_for_event, multiproof_for, ProofEngine
+from panautomata.lithium.store import MemoryBlockStore, SqliteBlockStore
+
+from fakerpc import synthetic_chain, CountingRPC
+
+
+HEIGHTS = range(10, 13)
+
+
+class BlockStoreTests(object):
+    def setUp(self):
+        self.fake = synthetic_chain(HEIGHTS, 20)
+        self.blocks = [process_block(self.fake, _)[0] for _ in HEIGHTS]
+        self.store = self.make_store()
+        for block in self.blocks:
+            self.store.put(block)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_get(self):
+        for block in self.blocks:
+            self.assertIn(block.height, self.store)
+            self.assertEqual(self.store.get(block.height), block)
+            self.assertEqual(self.store.tree(block.height).root, block.root)
+        self.assertNotIn(100, self.store)
+        self.assertIsNone(self.store.get(100))
+        self.assertIsNone(self.store.lookup('0x' + ('00' * 32)))
+
+    def test_proofs(self):
+        rpc = CountingRPC(self.fake)
+        for block in self.blocks:
+            for tx_hash in block.tx_hashes:
+                self.assertEqual(proof_for_tx(rpc, tx_hash, self.store), proof_for_tx(self.fake, tx_hash))
+                log_count = len(self.fake.eth_getTransactionReceipt(tx_hash)['logs'])
+                for log_idx in range(0, log_count):
+                    self.assertEqual(proof_for_event(rpc, tx_hash, log_idx, self.store),
+                                     proof_for_event(self.fake, tx_hash, log_idx))
+            refs = [(block.tx_hashes[0], None), (block.tx_hashes[1], 0), (block.tx_hashes[-1], None)]
+            self.assertEqual(multiproof_for(rpc, refs, self.store), multiproof_for(self.fake, refs))
+        # Every proof was made from the store
+        self.assertEqual(rpc.calls, [])
+
+    def test_not_found(self):
+        rpc = CountingRPC(self.fake)
+        engine = ProofEngine(rpc, self.store)
+        block = self.blocks[0]
+        contract_tx = self.fake.eth_getBlockByNumber(block.height, False)['transactions'][0]
+        with self.assertRaises(RuntimeError):
+            engine.prove_event(block.tx_hashes[0], 100)
+        with self.assertRaises(RuntimeError):
+            engine.prove_tx(contract_tx)
+        results = dict(engine.iter_proofs([(block.tx_hashes[0], 100), (contract_tx, None)]))
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all([isinstance(_, RuntimeError) for _ in results.values()]))
+        # Stored blocks aren't retrieved again to find what isn't in them
+        self.assertNotIn('eth_getBlockByNumber', rpc.calls)
+
+    def test_not_stored(self):
+        rpc = CountingRPC(self.fake)
+        store = self.make_store()
+        tx_hash = self.blocks[0].tx_hashes[0]
+        self.assertEqual(proof_for_tx(rpc, tx_hash, store), proof_for_tx(self.fake, tx_hash))
+        self.assertIn('eth_getBlockByNumber', rpc.calls)
+        store.close()
+
+    def test_replace(self):
+        block = self.blocks[1]._replace(height=self.blocks[0].height)
+        self.store.put(block)
+        self.assertEqual(self.store.get(block.height), block)
+        self.assertEqual(self.store.lookup(block.tx_hashes[0]).height, block.height)
+        self.assertIsNone(self.store.lookup(self.blocks[0].tx_hashes[0]))
+
+
+class TestMemoryBlockStore(BlockStoreTests, unittest.TestCase):
+    def make_store(self):
+        return MemoryBlockStore()
+
+
+class TestSqliteBlockStore(BlockStoreTests, unittest.TestCase):
+    def make_store(self):
+        return SqliteBlockStore()
+
+    def test_reopen(self):
+        path = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(path, 'blocks.db')
+            store = SqliteBlockStore(filename)
+            store.put(self.blocks[0])
+            store.close()
+
+            store = SqliteBlockStore(filename)
+            self.assertEqual(store.get(self.blocks[0].height), self.blocks[0])
+            tx_hash = self.blocks[0].tx_hashes[0]
+            self.assertEqual(proof_for_tx(None, tx_hash, store), proof_for_tx(self.fake, tx_hash))
+            store.close()
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
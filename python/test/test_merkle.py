@@ -1,7 +1,12 @@
+import os
+import pickle
+import struct
+import tempfile
 import unittest
+from concurrent.futures import ProcessPoolExecutor
 
-from panautomata.merkle import hashs, merkle_hash, merkle_tree, merkle_path, merkle_proof
-from panautomata.utils import bit_set
+from panautomata.merkle import hashs, merkle_hash, merkle_tree, merkle_path, merkle_path_by_index, merkle_multipath_by_index, merkle_all_paths, merkle_proof, merkle_multipath, merkle_multiproof, MerkleAccumulator, merkle_leaf_hash, merkle_node_hash, node_set, node_clear, merkle_tree_parallel, merkle_tree_save, merkle_tree_open, MerkleTree, TREE_HEADER, TREE_MAGIC, TREE_VERSION
+from panautomata.utils import bit_set, u256be
 
 
 class MerkleTest(unittest.TestCase):
@@ -30,3 +35,153 @@ class MerkleTest(unittest.TestCase):
                          115430900598740407475614477702451727417464276200488002297259396972341306878145,
                          27135588043166493562879989209820797655860974197851822040306875373032573005523,
                          85756528672499178608186934456948970484439097541346763434086993483185376933694])
+
+    def test_tree_layout(self):
+        tree, root = merkle_tree(list(range(0, 5)))
+        # 5 items, padded to 6, then 3 padded to 4, then 2, then the root
+        self.assertEqual(len(tree), 4)
+        self.assertEqual([tree.level_size(_) for _ in range(0, len(tree))], [6, 4, 2, 1])
+        self.assertEqual(len(tree.level(0)), 6 * 32)
+        self.assertEqual(tree.root, root)
+        self.assertEqual(tree.node(0, 5), u256be(merkle_hash(b"merkle-tree-extra")))
+        with self.assertRaises(ValueError):
+            merkle_path(1234, tree)
+
+        tree, root = merkle_tree([])
+        self.assertEqual(root, 0)
+        self.assertEqual(tree.root, 0)
+
+    def test_path_by_index(self):
+        items = list(range(0, 17))
+        tree, root = merkle_tree(items)
+        for item in items:
+            idx = tree.leaf_index(u256be(merkle_hash(item)))
+            path = merkle_path_by_index(idx, tree)
+            self.assertEqual(path, merkle_path(item, tree))
+            self.assertTrue(merkle_proof(item, path, root))
+        # The padding node isn't a leaf
+        self.assertEqual(tree.level_size(0), tree.leaf_count + 1)
+        with self.assertRaises(IndexError):
+            merkle_path_by_index(tree.leaf_count, tree)
+        with self.assertRaises(IndexError):
+            merkle_multipath_by_index([0, tree.leaf_count], tree)
+
+    def test_all_paths(self):
+        for i in range(0, 40):
+            tree, root = merkle_tree(list(range(0, i)))
+            all_paths = list(merkle_all_paths(tree))
+            self.assertEqual(len(all_paths), i)
+            for leaf_idx, path in all_paths:
+                self.assertEqual(path, merkle_path_by_index(leaf_idx, tree))
+
+    def test_multiproof(self):
+        for i in range(1, 34):
+            items = list(range(0, i))
+            tree, root = merkle_tree(items)
+            for subset in [items, items[:1], items[-1:], items[::2], items[1::3], items[:i // 2 + 1]]:
+                if not subset:
+                    continue
+                indices, path = merkle_multipath(subset, tree)
+                self.assertTrue(merkle_multiproof(subset, indices, path, root))
+                # Shared siblings are only included once
+                self.assertTrue(len(path) <= sum([len(merkle_path(_, tree)) for _ in subset]))
+                if len(subset) == 1:
+                    self.assertEqual(path, merkle_path(subset[0], tree))
+            indices, path = merkle_multipath(items[:1], tree)
+            self.assertFalse(merkle_multiproof(items[:1], indices, path, root + 1))
+            self.assertFalse(merkle_multiproof(items[:1], indices, path[:-1], root))
+
+    def test_multiproof_forged_index(self):
+        items = list(range(0, 17))
+        tree, root = merkle_tree(items)
+        for subset in [items[5:6], items[3:9]]:
+            indices, path = merkle_multipath(subset, tree)
+            self.assertTrue(merkle_multiproof(subset, indices, path, root))
+            for forged in range(-1, 64):
+                if forged in indices:
+                    continue
+                self.assertFalse(merkle_multiproof(subset, [forged] + indices[1:], path, root))
+            # Same position with different leaves
+            self.assertFalse(merkle_multiproof(subset + items[:1], indices + indices[:1], path, root))
+
+    def test_accumulator(self):
+        for i in range(0, 20):
+            items = list(range(i, 0, -1))
+            accumulator = MerkleAccumulator()
+            for item in items:
+                accumulator.add(item)
+            self.assertEqual(len(accumulator), i)
+            tree, root = accumulator.finalize()
+            expected_tree, expected_root = merkle_tree(items)
+            self.assertEqual(root, expected_root)
+            self.assertEqual(tree.level(0), expected_tree.level(0))
+
+    def test_bytes_hashing(self):
+        for item in [0, 98, 1 << 255, b'merkle-tree-extra', 'abc']:
+            self.assertEqual(merkle_leaf_hash(item), u256be(merkle_hash(item)))
+        a, b = merkle_hash(1), merkle_hash(2)
+        self.assertEqual(merkle_node_hash(u256be(a) + u256be(b)), u256be(merkle_hash(a, b)))
+        self.assertEqual(node_set(u256be(a)), u256be(bit_set(a, 0xFF)))
+        self.assertEqual(node_clear(node_set(u256be(a))), u256be(a))
+
+    def test_parallel(self):
+        with ProcessPoolExecutor(2) as executor:
+            for i in [1, 2, 4, 5, 8, 9, 16, 17, 31, 33, 64, 65]:
+                items = list(range(0, i))
+                tree, root = merkle_tree(items)
+                ptree, proot = merkle_tree_parallel(items, executor, shard_size=4)
+                self.assertEqual(proot, root)
+                self.assertEqual(len(ptree), len(tree))
+                for level in range(0, len(tree)):
+                    self.assertEqual(ptree.level(level), tree.level(level))
+                self.assertEqual(merkle_path(items[-1], ptree), merkle_path(items[-1], tree))
+
+    def test_pickle(self):
+        tree, root = merkle_tree(list(range(0, 7)))
+        copied = pickle.loads(pickle.dumps(tree))
+        self.assertEqual(copied.root, root)
+        self.assertEqual(merkle_path(3, copied), merkle_path(3, tree))
+
+    def test_save_open(self):
+        items = list(range(0, 13))
+        tree, root = merkle_tree(items)
+        copied = MerkleTree.frombytes(tree.tobytes())
+        self.assertEqual(copied.root, root)
+        self.assertEqual(copied.leaf_count, 13)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'tree.bin')
+            merkle_tree_save(tree, filename)
+            opened, opened_root = merkle_tree_open(filename)
+            self.assertEqual(opened_root, root)
+            for item in items:
+                self.assertEqual(merkle_path(item, opened), merkle_path(item, tree))
+            with self.assertRaises(ValueError):
+                merkle_path(1234, opened)
+        with self.assertRaises(RuntimeError):
+            MerkleTree.frombytes(tree.tobytes()[:-1])
+
+    def test_frombytes_invalid(self):
+        def pack(leaf_count, offsets, level_count=None):
+            if level_count is None:
+                level_count = len(offsets) - 1
+            header = TREE_HEADER.pack(TREE_MAGIC, TREE_VERSION, leaf_count, level_count)
+            nodes = b'\0' * 32 * (offsets[-1] if offsets else 0)
+            return header + struct.pack('>%dL' % (len(offsets),), *offsets) + nodes
+
+        tree, root = merkle_tree(list(range(0, 3)))
+        self.assertEqual(MerkleTree.frombytes(pack(3, [0, 4, 6, 7])).leaf_count, 3)
+        for data in [
+                # Truncated within the offsets
+                tree.tobytes()[:TREE_HEADER.size + 4],
+                pack(0, [], level_count=0),
+                # Offsets which don't start at zero, or decrease
+                pack(3, [1, 4, 6, 7]),
+                pack(3, [0, 4, 3, 7]),
+                pack(3, [0, 4, 4, 7]),
+                # More than one root
+                pack(3, [0, 4, 5, 7]),
+                # Leaf count larger, or much smaller, than the first level
+                pack(99, [0, 1]),
+                pack(1, [0, 4, 6, 7])]:
+            with self.assertRaises(RuntimeError):
+                MerkleTree.frombytes(data)
@@ -0,0 +1,189 @@
+import json
+import time
+import logging
+import socket
+import unittest
+import threading
+from http.client import HTTPConnection
+from binascii import unhexlify
+
+from flask import Flask
+
+from panautomata.ethrpc import EthJsonRpc
+from panautomata.lithium.common import process_block, process_transaction, verify_proof, proof_for_tx, ProofEngine
+from panautomata.lithium.proofserver import ProofBlueprint, ProofServer, make_app, STREAM_THRESHOLD, MAX_BATCH_SIZE
+
+from fakenode import FakeNode
+from fakerpc import synthetic_chain, block_tx_hash, SlowRPC
+
+
+HEIGHTS = range(10, 13)
+
+logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+
+class TestProofServer(unittest.TestCase):
+    def setUp(self):
+        self.fake = synthetic_chain(HEIGHTS, 60)
+        self.node = FakeNode(self.fake)
+        self.app = Flask(__name__)
+        self.app.register_blueprint(ProofBlueprint(EthJsonRpc(self.node.host, self.node.port)), url_prefix='/proof')
+        self.client = self.app.test_client()
+        self.tx_hashes = [self.fake.eth_getBlockByNumber(_, False)['transactions'] for _ in HEIGHTS]
+
+    def tearDown(self):
+        self.node.stop()
+
+    def block_requests(self):
+        return len([_ for _ in self.node.requests if _['method'] == 'eth_getBlockByNumber'])
+
+    def assertProof(self, tx_hash, proof):
+        root = process_block(self.fake, int(self.fake.eth_getTransactionByHash(tx_hash)['blockNumber'], 16))[0].root
+        self.assertTrue(verify_proof(root, process_transaction(self.fake, tx_hash), unhexlify(proof)))
+
+    def test_get(self):
+        tx_hash = self.tx_hashes[0][1]
+        response = self.client.get('/proof/' + tx_hash)
+        self.assertEqual(response.status_code, 200)
+        self.assertProof(tx_hash, response.get_json()['proof'])
+        self.assertEqual(self.client.get('/proof/' + tx_hash + '/0').status_code, 200)
+
+    def test_batch(self):
+        tx_hash = self.tx_hashes[0][1]
+        response = self.client.post('/proof/', json=[tx_hash, [tx_hash, 0], self.tx_hashes[0][0], [tx_hash, 100]])
+        self.assertEqual(response.status_code, 200)
+        proofs = response.get_json()['proofs']
+        self.assertEqual([_['index'] for _ in proofs], [0, 1, 2, 3])
+        self.assertProof(tx_hash, proofs[0]['proof'])
+        self.assertEqual(proofs[1]['log_idx'], 0)
+        self.assertIn('proof', proofs[1])
+        # Contract creation, and an event which doesn't exist
+        self.assertIn('error', proofs[2])
+        self.assertIn('error', proofs[3])
+        self.assertEqual(self.block_requests(), 1)
+
+    def test_batch_streamed(self):
+        entries = [_ for tx_hashes in self.tx_hashes for _ in tx_hashes[1:]]
+        entries = entries + [[_, 0] for _ in entries]
+        self.assertGreater(len(entries), STREAM_THRESHOLD)
+
+        response = self.client.post('/proof/', json=entries)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        proofs = json.loads(response.get_data(as_text=True))['proofs']
+        self.assertEqual(sorted([_['index'] for _ in proofs]), list(range(0, len(entries))))
+        for result in proofs:
+            if result['log_idx'] is None:
+                self.assertProof(entries[result['index']], result['proof'])
+        # Each block was retrieved once
+        self.assertEqual(self.block_requests(), len(HEIGHTS))
+
+    def test_batch_invalid(self):
+        self.assertEqual(self.client.post('/proof/', data='{').status_code, 400)
+        self.assertEqual(self.client.post('/proof/', json={'tx': '0x00'}).status_code, 400)
+        self.assertEqual(self.client.post('/proof/', json=['0x1234']).status_code, 400)
+        self.assertEqual(self.client.post('/proof/', json=[[self.tx_hashes[0][1], -1]]).status_code, 400)
+        self.assertEqual(self.client.post('/proof/', json=[[self.tx_hashes[0][1], True]]).status_code, 400)
+        self.assertEqual(self.client.post('/proof/', json=[self.tx_hashes[0][1]] * (MAX_BATCH_SIZE + 1)).status_code, 400)
+
+
+class TestProofServerWorkers(unittest.TestCase):
+    def setUp(self):
+        self.fake = synthetic_chain([10, 11], 10)
+        self.engine = ProofEngine(SlowRPC(self.fake, delay=1))
+        self.server = ProofServer('127.0.0.1', 0, make_app(self.engine), workers=4, timeout=1)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+
+    def get_proof(self, conn, tx_hash):
+        conn.request('GET', '/proof/' + tx_hash)
+        response = conn.getresponse()
+        self.assertEqual(response.status, 200)
+        return unhexlify(json.loads(response.read().decode('utf-8'))['proof'])
+
+    def connect(self):
+        return HTTPConnection('127.0.0.1', self.server.port, timeout=10)
+
+    def test_connection_closed(self):
+        self.engine.prove_tx(block_tx_hash(self.fake, 11))
+        conn = self.connect()
+        tx_hash = block_tx_hash(self.fake, 11)
+        self.assertEqual(self.get_proof(conn, tx_hash), proof_for_tx(self.fake, tx_hash))
+        # Connections aren't kept open to wait for more requests, which would hold a worker
+        self.assertIsNone(conn.sock)
+        # A new connection is made for the next request
+        self.assertEqual(self.get_proof(conn, tx_hash), proof_for_tx(self.fake, tx_hash))
+        conn.close()
+
+    def test_concurrent(self):
+        fast_tx = block_tx_hash(self.fake, 11)
+        slow_tx = block_tx_hash(self.fake, 10)
+        self.engine.prove_tx(fast_tx)
+
+        finished = []
+        def request(tx_hash):
+            conn = self.connect()
+            self.assertEqual(self.get_proof(conn, tx_hash), proof_for_tx(self.fake, tx_hash))
+            finished.append(tx_hash)
+            conn.close()
+        slow = threading.Thread(target=request, args=(slow_tx,))
+        slow.start()
+        time.sleep(0.1)
+        # Isn't delayed by the request which is waiting for the RPC server
+        request(fast_tx)
+        slow.join()
+        self.assertEqual(finished, [fast_tx, slow_tx])
+
+    def test_timeout(self):
+        sock = socket.create_connection(('127.0.0.1', self.server.port))
+        try:
+            # Incomplete request
+            sock.sendall(b'GET /proof/')
+            sock.settimeout(10)
+            started = time.time()
+            self.assertEqual(sock.recv(1), b'')
+            self.assertLess(time.time() - started, 5)
+        finally:
+            sock.close()
+
+    def test_max_connections(self):
+        server = ProofServer('127.0.0.1', 0, make_app(self.engine), workers=1, timeout=1, max_connections=2)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        idle = []
+        try:
+            # One connection is being handled, the other waits for the worker
+            for _ in range(0, 2):
+                sock = socket.create_connection(('127.0.0.1', server.port))
+                sock.sendall(b'GET /proof/')
+                idle.append(sock)
+            time.sleep(0.2)
+            conn = HTTPConnection('127.0.0.1', server.port, timeout=10)
+            conn.request('GET', '/proof/' + block_tx_hash(self.fake, 11))
+            self.assertEqual(conn.getresponse().status, 503)
+            conn.close()
+
+            # Accepted again once the idle connections time out
+            for sock in idle:
+                sock.settimeout(10)
+                self.assertEqual(sock.recv(1), b'')
+            conn = HTTPConnection('127.0.0.1', server.port, timeout=10)
+            tx_hash = block_tx_hash(self.fake, 11)
+            self.assertEqual(self.get_proof(conn, tx_hash), proof_for_tx(self.fake, tx_hash))
+            conn.close()
+        finally:
+            for sock in idle:
+                sock.close()
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    unittest.main()
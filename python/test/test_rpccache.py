@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from panautomata.ethrpc import EthJsonRpc
+from panautomata.rpccache import EthJsonRpcCache
+
+from fakenode import FakeNode
+from test_lithium_common import FAKERPC_INSTANCE
+
+
+TX_HASH = '0x87f2dd1a154c8f11a153bdcd90fc67ab850e9f32f05a5becc79d3fe035b1c4fd'
+
+BLOCK_HASH = '0x0ecee24d0107cfaa2eb4977d9a9c76e91c955b504820a15130928c180f3d3615'
+
+
+class PendingRPC(object):
+    """Transaction which hasn't been mined yet"""
+    def eth_getTransactionByHash(self, tx_hash):
+        return {'hash': tx_hash, 'blockHash': None, 'blockNumber': None}
+
+    def eth_getTransactionReceipt(self, tx_hash):
+        return None
+
+
+class TestEthJsonRpcCache(unittest.TestCase):
+    def setUp(self):
+        self.node = FakeNode(FAKERPC_INSTANCE)
+        self.cache = EthJsonRpcCache()
+        self.rpc = EthJsonRpc(self.node.host, self.node.port, cache=self.cache)
+
+    def tearDown(self):
+        self.node.stop()
+
+    def test_cached(self):
+        for _ in range(0, 3):
+            self.assertEqual(self.rpc.eth_getTransactionByHash(TX_HASH)['hash'], TX_HASH)
+            self.assertEqual(self.rpc.eth_getTransactionReceipt(TX_HASH)['transactionHash'], TX_HASH)
+            self.assertEqual(self.rpc.eth_getBlockByHash(BLOCK_HASH, False)['hash'], BLOCK_HASH)
+        self.assertEqual(len(self.node.requests), 3)
+        self.assertEqual(self.cache.stats(), dict(hits=6, misses=3, size=3))
+
+        # Blocks by number may change, and aren't cached
+        self.rpc.eth_getBlockByNumber(10, False)
+        self.rpc.eth_getBlockByNumber(10, False)
+        self.assertEqual(len(self.node.requests), 5)
+
+    def test_batch(self):
+        self.rpc.eth_getTransactionByHash(TX_HASH)
+        results = self.rpc.batch([('eth_getTransactionByHash', [TX_HASH]),
+                                  ('eth_getTransactionReceipt', [TX_HASH])])
+        self.assertEqual(results[0]['hash'], TX_HASH)
+        self.assertEqual(results[1]['transactionHash'], TX_HASH)
+        # Only the receipt was requested by the batch
+        self.assertEqual(len(self.node.requests[-1]), 1)
+        self.rpc.batch([('eth_getTransactionByHash', [TX_HASH]),
+                        ('eth_getTransactionReceipt', [TX_HASH])])
+        self.assertEqual(len(self.node.requests), 2)
+
+    def test_pending(self):
+        node = FakeNode(PendingRPC())
+        try:
+            rpc = EthJsonRpc(node.host, node.port, cache=self.cache)
+            for _ in range(0, 2):
+                self.assertIsNone(rpc.eth_getTransactionByHash(TX_HASH)['blockNumber'])
+                self.assertIsNone(rpc.eth_getTransactionReceipt(TX_HASH))
+            self.assertEqual(len(node.requests), 4)
+            self.assertEqual(len(self.cache), 0)
+        finally:
+            node.stop()
+
+    def test_lru(self):
+        cache = EthJsonRpcCache(max_size=2)
+        for idx in range(0, 3):
+            cache.put('eth_getBlockByHash', [hex(idx), False], {'hash': hex(idx)})
+        cache.get('eth_getBlockByHash', [hex(1), False])
+        cache.put('eth_getBlockByHash', [hex(3), False], {'hash': hex(3)})
+        self.assertIsNone(cache.get('eth_getBlockByHash', [hex(0), False]))
+        self.assertIsNone(cache.get('eth_getBlockByHash', [hex(2), False]))
+        self.assertEqual(cache.get('eth_getBlockByHash', [hex(1), False]), {'hash': hex(1)})
+        self.assertEqual(len(cache), 2)
+
+    def test_persist(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempdir, 'rpc.cache')
+            cache = EthJsonRpcCache(path=path)
+            EthJsonRpc(self.node.host, self.node.port, cache=cache).eth_getTransactionByHash(TX_HASH)
+            cache.close()
+
+            cache = EthJsonRpcCache(path=path)
+            rpc = EthJsonRpc(self.node.host, self.node.port, cache=cache)
+            self.assertEqual(rpc.eth_getTransactionByHash(TX_HASH)['hash'], TX_HASH)
+            self.assertEqual(len(self.node.requests), 1)
+            self.assertEqual(cache.hits, 1)
+            cache.close()
+        finally:
+            shutil.rmtree(tempdir)
@@ -0,0 +1,83 @@
+import time
+import unittest
+
+from panautomata.args import arg_ethrpc
+from panautomata.ethrpc import EthJsonRpc, ConnectionError
+from panautomata.rpcpool import EthJsonRpcPool
+
+from fakechain import FakeDevChain
+from fakenode import FakeNode
+
+
+class BrokenRPC(EthJsonRpc):
+    """Fails with an error which isn't a node error"""
+    def _post(self, data):
+        raise ValueError("Broken")
+
+
+class TestEthJsonRpcPool(unittest.TestCase):
+    def setUp(self):
+        self.chain = FakeDevChain()
+        self.nodes = [FakeNode(self.chain) for _ in range(0, 3)]
+        self.rpc = EthJsonRpcPool([EthJsonRpc(_.host, _.port) for _ in self.nodes], failure_threshold=2)
+
+    def tearDown(self):
+        for node in self.nodes:
+            node.stop()
+
+    def test_balanced(self):
+        for _ in range(0, 9):
+            self.assertEqual(self.rpc.eth_blockNumber(), 0)
+        self.assertEqual([len(_.requests) for _ in self.nodes], [3, 3, 3])
+
+    def test_sticky(self):
+        for _ in range(0, 3):
+            self.rpc.eth_getTransactionCount('0x' + ('11' * 20), 'pending')
+        self.assertEqual([len(_.requests) for _ in self.nodes], [3, 0, 0])
+
+    def test_failover(self):
+        self.nodes[0].stop()
+        for _ in range(0, 6):
+            self.assertEqual(self.rpc.eth_blockNumber(), 0)
+        # Circuit of the failed node is open, it's no longer tried
+        self.assertEqual(self.rpc.nodes[0].failures, 2)
+        self.assertGreater(self.rpc.nodes[0].open_until, 0)
+
+        # Writes fail over to the next preferred node
+        self.rpc.eth_getTransactionCount('0x' + ('11' * 20), 'pending')
+        self.assertEqual(self.nodes[1].requests[-1]['method'], 'eth_getTransactionCount')
+
+    def test_recovery(self):
+        self.rpc.cooldown = 0.1
+        self.nodes[0].stop()
+        for _ in range(0, 6):
+            self.rpc.eth_blockNumber()
+        self.assertGreater(self.rpc.nodes[0].open_until, 0)
+
+        # Tried again by requests once the cooldown has passed
+        self.nodes[0] = FakeNode(self.chain)
+        self.rpc.nodes[0].rpc = EthJsonRpc(self.nodes[0].host, self.nodes[0].port)
+        time.sleep(0.2)
+        for _ in range(0, 3):
+            self.assertEqual(self.rpc.eth_blockNumber(), 0)
+        self.assertEqual(len(self.nodes[0].requests), 1)
+        self.assertEqual(self.rpc.nodes[0].failures, 0)
+
+    def test_unexpected_error(self):
+        self.rpc.nodes[0].rpc = BrokenRPC(self.nodes[0].host, self.nodes[0].port)
+        with self.assertRaises(ValueError):
+            self.rpc.eth_getTransactionCount('0x' + ('11' * 20), 'pending')
+        self.assertEqual([_.in_flight for _ in self.rpc.nodes], [0, 0, 0])
+
+    def test_all_failed(self):
+        for node in self.nodes:
+            node.stop()
+        with self.assertRaises(ConnectionError):
+            self.rpc.eth_blockNumber()
+
+    def test_arg_ethrpc(self):
+        rpc = arg_ethrpc(None, None, '127.0.0.1:8545')
+        self.assertIsInstance(rpc, EthJsonRpc)
+        self.assertNotIsInstance(rpc, EthJsonRpcPool)
+        pool = arg_ethrpc(None, None, '127.0.0.1:8545, 127.0.0.2:8546')
+        self.assertEqual([str(_) for _ in pool.nodes], ['127.0.0.1:8545', '127.0.0.2:8546'])
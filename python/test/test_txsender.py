@@ -0,0 +1,97 @@
+import threading
+import unittest
+
+from panautomata.abi import AbiRegistry
+from panautomata.ethrpc import EthJsonRpc, EthJsonRpcError
+from panautomata.txsender import TransactionSender
+from panautomata.watcher import ReceiptWatcher
+
+from fakechain import FakeDevChain
+from fakenode import FakeNode
+from test_abi import TOKEN_ABI
+
+
+KEY = b'\x01' * 32
+
+ADDRESS = '1a642f0e3c3af545e7acbd38b07251b3990914f1'
+
+CONTRACT = '0x' + ('22' * 20)
+
+
+class TestTransactionSender(unittest.TestCase):
+    def setUp(self):
+        self.chain = FakeDevChain()
+        self.node = FakeNode(self.chain)
+        self.rpc = EthJsonRpc(self.node.host, self.node.port)
+        self.sender = TransactionSender(self.rpc, KEY)
+
+    def tearDown(self):
+        if self.rpc.watcher is not None:
+            self.rpc.watcher.stop()
+        self.node.stop()
+
+    def test_pipelined(self):
+        self.assertEqual(self.sender.address, ADDRESS)
+        txs = [self.sender.send_transaction(CONTRACT, b'hello') for _ in range(0, 5)]
+        self.assertEqual(sorted([_['nonce'] for _ in self.chain.pool.values()]), list(range(0, 5)))
+        self.assertTrue(all([_['from'] == ADDRESS for _ in self.chain.pool.values()]))
+        self.assertEqual(len(self.sender), 5)
+
+        self.chain.mine()
+        self.assertEqual(self.sender.refresh(), 0)
+        self.assertEqual([_.receipt()['blockNumber'] for _ in txs], ['0x1'] * 5)
+
+    def test_chain_id(self):
+        sender = TransactionSender(self.rpc, KEY, chain_id=1337)
+        sender.send_transaction(CONTRACT, b'hello')
+        self.assertEqual(list(self.chain.pool.values())[0]['from'], ADDRESS)
+
+    def test_dropped(self):
+        txs = [self.sender.send_transaction(CONTRACT, b'') for _ in range(0, 3)]
+        self.chain.drop(txs[1].txid)
+        self.chain.mine()
+        # Only the first was mined, the rest are stuck behind the gap
+        self.assertEqual(self.sender.refresh(), 2)
+        self.assertIn(txs[1].txid, self.chain.pool)
+        self.chain.mine()
+        self.assertEqual(self.sender.refresh(), 0)
+
+    def test_failed(self):
+        self.chain.min_gas_price = self.rpc.DEFAULT_GAS_PRICE
+        self.sender.send_transaction(CONTRACT, b'')
+        with self.assertRaises(EthJsonRpcError):
+            self.sender.send_transaction(CONTRACT, b'', gas_price=self.chain.min_gas_price - 1)
+        self.sender.send_transaction(CONTRACT, b'')
+        # The nonce of the failed transaction is re-used
+        self.assertEqual(sorted([_['nonce'] for _ in self.chain.pool.values()]), [0, 1])
+
+    def test_nonce_too_low(self):
+        self.sender.send_transaction(CONTRACT, b'')
+        self.chain.mine()
+        # Transactions sent elsewhere from the same account
+        self.chain.nonces[ADDRESS] = 5
+        tx = self.sender.send_transaction(CONTRACT, b'')
+        self.assertEqual(self.chain.pool[tx.txid]['nonce'], 5)
+
+    def test_replace(self):
+        tx = self.sender.send_transaction(CONTRACT, b'')
+        replacement = self.sender.replace(tx)
+        self.assertEqual(list(self.chain.pool.keys()), [replacement.txid])
+        self.assertGreater(self.chain.pool[replacement.txid]['gasPrice'], self.rpc.DEFAULT_GAS_PRICE)
+        self.assertEqual(self.sender.pending[0].txid, replacement.txid)
+
+    def test_max_pending(self):
+        self.rpc.watcher = ReceiptWatcher(self.rpc, interval=0.01)
+        sender = TransactionSender(self.rpc, KEY, max_pending=2)
+        for _ in range(0, 2):
+            sender.send_transaction(CONTRACT, b'')
+        timer = threading.Timer(0.1, self.chain.mine)
+        timer.start()
+        sender.send_transaction(CONTRACT, b'')
+        timer.join()
+        self.assertEqual(len(sender), 1)
+
+    def test_proxy(self):
+        token = self.rpc.proxy(AbiRegistry().load(TOKEN_ABI), CONTRACT, self.sender)
+        tx = token.transfer(CONTRACT, 10)
+        self.assertEqual(self.chain.pool[tx.txid]['input'][:8], 'a9059cbb')
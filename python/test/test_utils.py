@@ -0,0 +1,30 @@
+import unittest
+
+from panautomata.utils import bytes_to_int, u256be, pack_u256_array, unpack_u256_array, pack_u64_array, unpack_u64_array, pack_u32_array, unpack_u32_array
+
+
+class UtilsTest(unittest.TestCase):
+    def test_u256_array(self):
+        values = [0, 1, (1 << 255), (1 << 256) - 1]
+        packed = pack_u256_array(values)
+        self.assertEqual(packed, b''.join([u256be(_) for _ in values]))
+        self.assertEqual(unpack_u256_array(packed), values)
+        self.assertEqual(unpack_u256_array(memoryview(packed)[32:]), values[1:])
+        self.assertEqual(unpack_u256_array(b''), [])
+        with self.assertRaises(RuntimeError):
+            unpack_u256_array(packed[1:])
+        with self.assertRaises(OverflowError):
+            pack_u256_array([1 << 256])
+
+    def test_small_arrays(self):
+        values = [0, 1, 0xFFFFFFFF]
+        self.assertEqual(unpack_u32_array(pack_u32_array(values)), values)
+        self.assertEqual(len(pack_u32_array(values)), 12)
+        values = [0, 1, 0xFFFFFFFFFFFFFFFF]
+        self.assertEqual(unpack_u64_array(pack_u64_array(values)), values)
+        self.assertEqual(len(pack_u64_array(values)), 24)
+
+    def test_bytes_to_int(self):
+        self.assertEqual(bytes_to_int(b''), 0)
+        self.assertEqual(bytes_to_int(b'\x01\x00'), 256)
+        self.assertEqual(bytes_to_int(memoryview(b'\x00\x02')), 2)
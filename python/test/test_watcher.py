@@ -0,0 +1,101 @@
+import unittest
+from concurrent.futures import TimeoutError
+
+from panautomata.ethrpc import EthJsonRpc, EthTransaction
+from panautomata.watcher import ReceiptWatcher
+
+from fakenode import FakeNode
+
+
+class FakeChain(object):
+    """Transactions are mined by calling `mine`"""
+    def __init__(self):
+        self.height = 1
+        self.receipts = dict()
+
+    def mine(self, *tx_hashes):
+        self.height += 1
+        for tx_hash in tx_hashes:
+            self.receipts[tx_hash] = {'transactionHash': tx_hash, 'blockNumber': hex(self.height),
+                                      'blockHash': '0x%064x' % (self.height,), 'status': '0x1'}
+
+    def eth_blockNumber(self):
+        return hex(self.height)
+
+    def eth_getTransactionReceipt(self, tx_hash):
+        return self.receipts.get(tx_hash)
+
+
+class FailingRPC(object):
+    """Raises an error which isn't from the RPC server, the first time a block number is requested"""
+    def __init__(self, rpc):
+        self.rpc = rpc
+        self.failures = 0
+
+    def eth_blockNumber(self):
+        if not self.failures:
+            self.failures += 1
+            raise ValueError("Unexpected")
+        return self.rpc.eth_blockNumber()
+
+    def __getattr__(self, name):
+        return getattr(self.rpc, name)
+
+
+TX_HASHES = ['0x%064x' % (_,) for _ in range(1, 11)]
+
+
+class TestReceiptWatcher(unittest.TestCase):
+    def setUp(self):
+        self.chain = FakeChain()
+        self.node = FakeNode(self.chain)
+        self.rpc = EthJsonRpc(self.node.host, self.node.port)
+        self.watcher = ReceiptWatcher(self.rpc, interval=0.01)
+
+    def tearDown(self):
+        self.watcher.stop()
+        self.node.stop()
+
+    def test_wait_all(self):
+        self.chain.mine(*TX_HASHES[:3])
+        found = []
+        futures = [self.watcher.watch(_, found.append) for _ in TX_HASHES]
+        with self.assertRaises(TimeoutError):
+            self.watcher.wait_all(TX_HASHES, timeout=0.2)
+        self.assertTrue(all([_.done() for _ in futures[:3]]))
+        self.assertEqual(len(self.watcher), 7)
+
+        self.chain.mine(*TX_HASHES[3:])
+        receipts = self.watcher.wait_all(TX_HASHES, timeout=5)
+        self.assertEqual([_['transactionHash'] for _ in receipts], TX_HASHES)
+        self.assertEqual(sorted([_['transactionHash'] for _ in found]), TX_HASHES)
+        self.assertEqual(len(self.watcher), 0)
+
+    def test_batched(self):
+        futures = [self.watcher.watch(_) for _ in TX_HASHES]
+        self.chain.mine(*TX_HASHES)
+        for future in futures:
+            future.result(timeout=5)
+        # Receipts are requested together, not once per transaction
+        batches = [_ for _ in self.node.requests if isinstance(_, list)]
+        self.assertTrue(all([len(_) == len(TX_HASHES) for _ in batches]))
+        self.assertFalse([_ for _ in self.node.requests if isinstance(_, dict) and _['method'] != 'eth_blockNumber'])
+
+    def test_error(self):
+        rpc = FailingRPC(self.rpc)
+        self.watcher = ReceiptWatcher(rpc, interval=0.01)
+        self.chain.mine(TX_HASHES[0])
+        with self.assertLogs('panautomata.watcher'):
+            receipt = self.watcher.watch(TX_HASHES[0]).result(timeout=5)
+        self.assertEqual(receipt['transactionHash'], TX_HASHES[0])
+        self.assertEqual(rpc.failures, 1)
+
+    def test_transaction(self):
+        self.rpc.watcher = self.watcher
+        ticks = []
+        transaction = EthTransaction(self.rpc, TX_HASHES[0])
+        self.assertIsNone(transaction.receipt())
+        self.watcher.watch(TX_HASHES[1], lambda _: self.chain.mine(TX_HASHES[0]))
+        self.chain.mine(TX_HASHES[1])
+        receipt = transaction.receipt(wait=True, tick_fn=ticks.append)
+        self.assertEqual(receipt['transactionHash'], TX_HASHES[0])